@@ -5,13 +5,29 @@ Uses SQLAlchemy async with SQLite for storing processing history.
 All operations are designed to fail gracefully without affecting main OCR functionality.
 """
 import logging
+import zlib
+from collections.abc import Sequence
 from datetime import datetime
+from operator import attrgetter
 from pathlib import Path
 from typing import Any
 
-from sqlalchemy import String, Text, Float, Integer, ForeignKey, DateTime, Index
+from sqlalchemy import (
+    String,
+    Text,
+    Float,
+    Integer,
+    ForeignKey,
+    DateTime,
+    Index,
+    LargeBinary,
+    TypeDecorator,
+    event,
+    func,
+)
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 logger = logging.getLogger(__name__)
 
@@ -20,9 +36,71 @@ DATABASE_DIR = Path("data")
 DATABASE_PATH = DATABASE_DIR / "ocr.db"
 DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
 
+# PRAGMAs applied to every new SQLite connection. WAL lets readers proceed while a
+# writer commits, and synchronous=NORMAL is safe under WAL (one fsync per checkpoint
+# instead of two per commit).
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",  # 64MB page cache
+    "PRAGMA mmap_size=268435456",  # 256MB
+)
+
+# Indexes added after the tables were first released. create_all only creates indexes
+# together with their (missing) table, so databases from earlier versions get them here.
+INDEX_STATEMENTS = (
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON processing_jobs(status, created_at)",
+)
+
+# Trigram FTS5 index over filenames, kept in sync with processing_jobs by triggers.
+# The trigram tokenizer matches arbitrary substrings, so it can stand in for
+# `filename LIKE '%term%'` without a full table scan.
+FTS_TABLE = "processing_jobs_fts"
+FTS_STATEMENTS = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "filename, content='processing_jobs', content_rowid='rowid', tokenize='trigram')",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON processing_jobs BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, filename) VALUES (new.rowid, new.filename);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON processing_jobs BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, filename)
+        VALUES ('delete', old.rowid, old.filename);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF filename ON processing_jobs
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, filename)
+        VALUES ('delete', old.rowid, old.filename);
+        INSERT INTO {FTS_TABLE}(rowid, filename) VALUES (new.rowid, new.filename);
+    END""",
+)
+# Indexes the jobs already in the table; only run when the index is first created,
+# the triggers keep it in sync from then on. processing_jobs has no INTEGER PRIMARY
+# KEY, so a VACUUM may renumber its rowids: run this by hand after one.
+FTS_REBUILD = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+
+# Column names exposed by to_dict. Timestamps are left as datetime objects; the API
+# serializes them with orjson, which renders datetimes natively.
+_JOB_KEYS = (
+    "id",
+    "filename",
+    "status",
+    "error_message",
+    "total_pages",
+    "full_text",
+    "created_at",
+    "completed_at",
+)
+# Columns for the history list view, which never shows the (potentially large) text
+_JOB_SUMMARY_KEYS = tuple(key for key in _JOB_KEYS if key != "full_text")
+_PAGE_KEYS = ("id", "job_id", "page_number", "image_path", "text", "confidence", "created_at")
+_job_columns = attrgetter(*_JOB_KEYS)
+_page_columns = attrgetter(*_PAGE_KEYS)
+
 # Global engine and session factory
 engine: Any = None
 async_session_factory: async_sessionmaker[AsyncSession] | None = None
+fts_available: bool = False
 
 
 class Base(DeclarativeBase):
@@ -31,6 +109,29 @@ class Base(DeclarativeBase):
     pass
 
 
+class CompressedText(TypeDecorator[str]):
+    """
+    Text stored as a zlib-compressed BLOB.
+
+    OCR output compresses several times over, so large documents take far fewer
+    database pages. Values written before compression was introduced are stored as
+    TEXT and are returned unchanged.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: str | None, dialect: Any) -> bytes | None:
+        if value is None:
+            return None
+        return zlib.compress(value.encode("utf-8"))
+
+    def process_result_value(self, value: bytes | str | None, dialect: Any) -> str | None:
+        if value is None or isinstance(value, str):
+            return value
+        return zlib.decompress(value).decode("utf-8")
+
+
 class ProcessingJob(Base):
     """Model for PDF processing jobs."""
 
@@ -41,29 +142,35 @@ class ProcessingJob(Base):
     status: Mapped[str] = mapped_column(String(20), nullable=False, default="processing")
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
     total_pages: Mapped[int] = mapped_column(Integer, default=0)
-    full_text: Mapped[str | None] = mapped_column(Text, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    full_text: Mapped[str | None] = mapped_column(CompressedText, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=func.now(), server_default=func.now(), nullable=False
+    )
     completed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
     # Relationship to pages
     pages: Mapped[list["ProcessingPage"]] = relationship(
-        "ProcessingPage", back_populates="job", cascade="all, delete-orphan"
+        "ProcessingPage", back_populates="job", cascade="all, delete-orphan", lazy="raise"
     )
 
-    __table_args__ = (Index("idx_jobs_created", "created_at"),)
+    __table_args__ = (
+        Index("idx_jobs_created", "created_at"),
+        Index("idx_jobs_status_created", "status", "created_at"),
+    )
 
     def to_dict(self) -> dict[str, Any]:
         """Convert to dictionary for JSON serialization."""
-        return {
-            "id": self.id,
-            "filename": self.filename,
-            "status": self.status,
-            "error_message": self.error_message,
-            "total_pages": self.total_pages,
-            "full_text": self.full_text,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
-        }
+        return dict(zip(_JOB_KEYS, _job_columns(self)))
+
+    @classmethod
+    def summary_columns(cls) -> tuple[Any, ...]:
+        """Columns to select for list views (everything except full_text)."""
+        return tuple(getattr(cls, key) for key in _JOB_SUMMARY_KEYS)
+
+    @classmethod
+    def to_summary_dict(cls, row: Sequence[Any]) -> dict[str, Any]:
+        """Convert a row selected with summary_columns() to a dictionary."""
+        return dict(zip(_JOB_SUMMARY_KEYS, row))
 
 
 class ProcessingPage(Base):
@@ -77,24 +184,30 @@ class ProcessingPage(Base):
     image_path: Mapped[str | None] = mapped_column(String(500), nullable=True)
     text: Mapped[str | None] = mapped_column(Text, nullable=True)
     confidence: Mapped[float | None] = mapped_column(Float, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=func.now(), server_default=func.now(), nullable=False
+    )
 
     # Relationship to job
-    job: Mapped["ProcessingJob"] = relationship("ProcessingJob", back_populates="pages")
+    job: Mapped["ProcessingJob"] = relationship(
+        "ProcessingJob", back_populates="pages", lazy="raise"
+    )
 
     __table_args__ = (Index("idx_pages_job", "job_id"),)
 
     def to_dict(self) -> dict[str, Any]:
         """Convert to dictionary for JSON serialization."""
-        return {
-            "id": self.id,
-            "job_id": self.job_id,
-            "page_number": self.page_number,
-            "image_path": self.image_path,
-            "text": self.text,
-            "confidence": self.confidence,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-        }
+        return dict(zip(_PAGE_KEYS, _page_columns(self)))
+
+
+def _set_sqlite_pragmas(dbapi_conn: Any, _connection_record: Any) -> None:
+    """Apply SQLITE_PRAGMAS on each new DBAPI connection."""
+    cursor = dbapi_conn.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
 
 
 async def init_database() -> bool:
@@ -104,18 +217,36 @@ async def init_database() -> bool:
     Returns:
         True if initialization succeeded, False otherwise
     """
-    global engine, async_session_factory
+    global engine, async_session_factory, fts_available
 
     try:
         # Ensure data directory exists
         DATABASE_DIR.mkdir(parents=True, exist_ok=True)
 
-        # Create async engine
-        engine = create_async_engine(DATABASE_URL, echo=False)
+        # Create async engine with a connection pool: aiosqlite defaults to NullPool for
+        # file databases, which spins up a new connection thread (and an empty page cache)
+        # per session. The timeout tolerates brief writer locks under WAL.
+        engine = create_async_engine(
+            DATABASE_URL,
+            echo=False,
+            connect_args={"timeout": 30},
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=5,
+            max_overflow=10,
+            pool_recycle=3600,
+        )
+
+        if DATABASE_URL.startswith("sqlite"):
+            event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
 
         # Create tables
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            for statement in INDEX_STATEMENTS:
+                await conn.exec_driver_sql(statement)
+
+        if DATABASE_URL.startswith("sqlite"):
+            fts_available = await _init_fts()
 
         # Create session factory
         async_session_factory = async_sessionmaker(engine, expire_on_commit=False)
@@ -130,14 +261,41 @@ async def init_database() -> bool:
         return False
 
 
+async def _init_fts() -> bool:
+    """
+    Create the filename FTS5 index and its sync triggers.
+
+    A newly created index is filled from the existing jobs; an existing one is
+    left as it is.
+
+    Returns:
+        True if the index is usable, False if FTS5/trigram is unsupported
+    """
+    try:
+        async with engine.begin() as conn:
+            result = await conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+            )
+            created = result.first() is None
+            for statement in FTS_STATEMENTS:
+                await conn.exec_driver_sql(statement)
+            if created:
+                await conn.exec_driver_sql(FTS_REBUILD)
+        return True
+    except Exception as e:
+        logger.warning(f"Filename search index unavailable (falling back to LIKE): {e}")
+        return False
+
+
 async def close_database() -> None:
     """Close database connection."""
-    global engine, async_session_factory
+    global engine, async_session_factory, fts_available
 
     if engine:
         await engine.dispose()
         engine = None
         async_session_factory = None
+        fts_available = False
         logger.info("Database connection closed")
 
 
@@ -8,6 +8,9 @@ from typing import Any
 
 import requests
 
+# Shared session so repeated uploads reuse the same keep-alive connection
+_session = requests.Session()
+
 
 def process_pdf(
     pdf_path: str, output_path: str, service_url: str = "http://localhost:8000"
@@ -33,21 +36,25 @@ def process_pdf(
     try:
         # Upload and process PDF
         with open(pdf_path, "rb") as f:
-            response = requests.post(
+            response = _session.post(
                 f"{service_url}/process-pdf",
-                files={"file": (os.path.basename(pdf_path), f, "application/pdf")}
+                files={"file": (os.path.basename(pdf_path), f, "application/pdf")},
+                stream=True,
             )
         
-        if response.status_code == 200:
-            # Save processed PDF
-            with open(output_path, "wb") as f:
-                f.write(response.content)
-            print(f"✓ Success! Saved to: {output_path}")
-            return True
-        else:
-            print(f"✗ Error: {response.status_code}")
-            print(f"Details: {response.text}")
-            return False
+        # Closing the streamed response releases its connection on every path
+        with response:
+            if response.status_code == 200:
+                # Save processed PDF without holding it all in memory
+                with open(output_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+                print(f"✓ Success! Saved to: {output_path}")
+                return True
+            else:
+                print(f"✗ Error: {response.status_code}")
+                print(f"Details: {response.text}")
+                return False
     
     except Exception as e:
         print(f"✗ Error: {e}")
@@ -75,7 +82,7 @@ def extract_text(pdf_path: str, service_url: str = "http://localhost:8000") -> d
     try:
         # Upload and extract text
         with open(pdf_path, "rb") as f:
-            response = requests.post(
+            response = _session.post(
                 f"{service_url}/extract-text",
                 files={"file": (os.path.basename(pdf_path), f, "application/pdf")}
             )
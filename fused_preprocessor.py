@@ -0,0 +1,123 @@
+"""
+Single-pass input preparation for docTR predictors.
+
+docTR's own pre-processor handles each page in separate passes over its pixels:
+it copies the array into a tensor, resizes and pads it, converts it to float (with
+/255), stacks the batch and then normalizes it. This module replaces those passes,
+for the plain uint8/float32 arrays this service feeds docTR, with one OpenCV resize
+per page that is scaled and offset in place inside the preallocated batch. The
+output follows docTR's layout exactly (aspect-preserving resize, optional
+symmetric padding, padding normalized like zero pixels), so its post-processing
+maps boxes back unchanged.
+"""
+import math
+from typing import cast
+
+import cv2
+import numpy as np
+import torch
+from doctr.models.preprocessor import PreProcessor
+from doctr.transforms import Resize
+from torch import nn
+
+
+class FusedPreProcessor(nn.Module):
+    """
+    docTR pre-processor replacement that resizes and normalizes in one pass.
+
+    Inputs other than a list of HxWx3 uint8/float32 arrays are passed through to
+    the wrapped pre-processor.
+
+    Args:
+        pre_processor: The predictor's docTR PreProcessor
+    """
+
+    pre_processor: PreProcessor
+    resize: Resize
+    batch_size: int
+
+    def __init__(self, pre_processor: PreProcessor) -> None:
+        super().__init__()
+        self.pre_processor = pre_processor
+        # docTR annotates the attribute as torchvision's Resize, but builds its own
+        # subclass, which adds the aspect ratio and padding options read here
+        self.resize = cast(Resize, pre_processor.resize)
+        self.batch_size = pre_processor.batch_size
+        mean = np.asarray(pre_processor.normalize.mean, dtype=np.float32)
+        std = np.asarray(pre_processor.normalize.std, dtype=np.float32)
+        # (x - mean) / std == x * scale + offset, per channel
+        self._scale = 1 / std
+        self._offset = -mean / std
+
+    def forward(
+        self, x: torch.Tensor | np.ndarray | list[torch.Tensor | np.ndarray]
+    ) -> list[torch.Tensor]:
+        """
+        Resize, pad, batch and normalize pages like docTR's PreProcessor.
+
+        Args:
+            x: Inputs accepted by docTR's PreProcessor
+
+        Returns:
+            List of (N, 3, H, W) float32 batches
+        """
+        if not isinstance(x, list) or not all(
+            isinstance(sample, np.ndarray)
+            and sample.ndim == 3
+            and sample.shape[2] == 3
+            and sample.dtype in (np.uint8, np.float32)
+            for sample in x
+        ):
+            return self.pre_processor(x)
+        arrays = cast(list[np.ndarray], x)
+
+        # PreProcessor always gives Resize its (H, W) output size, never a single int
+        height, width = cast(tuple[int, int], self.resize.size)
+        batches: list[torch.Tensor] = []
+        for start in range(0, len(arrays), self.batch_size):
+            samples = arrays[start : start + self.batch_size]
+            batch = np.empty((len(samples), 3, height, width), dtype=np.float32)
+            # docTR pads with zeros before normalizing
+            batch[:] = self._offset[None, :, None, None]
+            for page, sample in zip(batch, samples):
+                resized, top, left = self._fit(sample, height, width)
+                # uint8 pixels are scaled to [0, 1] first, float32 ones already are
+                pixel_scale = 1 / 255 if sample.dtype == np.uint8 else 1.0
+                rows = slice(top, top + resized.shape[0])
+                cols = slice(left, left + resized.shape[1])
+                for channel in range(3):
+                    np.multiply(
+                        resized[..., channel],
+                        self._scale[channel] * pixel_scale,
+                        out=page[channel, rows, cols],
+                        casting="unsafe",
+                    )
+                    page[channel, rows, cols] += self._offset[channel]
+            batches.append(torch.from_numpy(batch))
+        return batches
+
+    def _fit(self, sample: np.ndarray, height: int, width: int) -> tuple[np.ndarray, int, int]:
+        """
+        Resize a sample the way docTR's Resize does and locate it in the padded output.
+
+        Returns:
+            Tuple of (resized HxWx3 array, top offset, left offset)
+        """
+        actual_ratio = sample.shape[0] / sample.shape[1]
+        target_ratio = height / width
+        if not self.resize.preserve_aspect_ratio or actual_ratio == target_ratio:
+            size = (height, width)
+        elif actual_ratio > target_ratio:
+            size = (height, max(int(height / actual_ratio), 1))
+        else:
+            size = (max(int(width * actual_ratio), 1), width)
+
+        # Area averaging is what antialiased downscaling approximates; it would
+        # blockify upscaled crops, so those use bilinear instead
+        shrinking = size[0] < sample.shape[0] or size[1] < sample.shape[1]
+        interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR
+        resized = cv2.resize(sample, (size[1], size[0]), interpolation=interpolation)
+
+        if not self.resize.symmetric_pad:
+            return resized, 0, 0
+        return resized, math.ceil((height - size[0]) / 2), math.ceil((width - size[1]) / 2)
@@ -3,18 +3,25 @@ History service for tracking OCR processing jobs.
 
 All operations are non-blocking and fail gracefully - errors are logged
 but never propagated to callers. This ensures main OCR functionality
-is never affected by history tracking issues.
+is never affected by history tracking issues. Writes are queued to a
+background writer (see start_writer) so requests never wait on commits.
 """
+import asyncio
 import logging
 import shutil
 import uuid
-from datetime import datetime
+from collections.abc import Awaitable, Callable
 from pathlib import Path
 from typing import Any
 
+import cv2
+import numpy as np
 from PIL import Image
-from sqlalchemy import select, func, desc
+from sqlalchemy import select, func, desc, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
+import database
 from database import (
     ProcessingJob,
     ProcessingPage,
@@ -27,7 +34,28 @@ logger = logging.getLogger(__name__)
 # Image storage configuration
 IMAGES_DIR = Path("static/images")
 THUMBNAIL_WIDTH = 400
-THUMBNAIL_QUALITY = 80
+THUMBNAIL_QUALITY = 75
+
+# SQLite (even in WAL mode) allows a single writer at a time; serialize writes here
+# instead of letting concurrent sessions contend on the database lock.
+_write_lock = asyncio.Semaphore(1)
+
+# Background writer configuration
+WRITE_QUEUE_SIZE = 1024
+WRITE_BATCH_SIZE = 64
+
+# A queued write: applies its changes to a session, which the writer commits
+HistoryWrite = Callable[[AsyncSession], Awaitable[None]]
+
+# Queue entry: log description, write, and a future resolved once it is committed
+_QueuedWrite = tuple[str, HistoryWrite, asyncio.Future[None]]
+
+_write_queue: asyncio.Queue[_QueuedWrite] | None = None
+_writer_task: asyncio.Task[None] | None = None
+
+# Future of the latest queued write of each job; the writer commits in order, so
+# once it resolves all of the job's earlier writes are committed too
+_pending_writes: dict[str, asyncio.Future[None]] = {}
 
 
 def _ensure_images_dir() -> None:
@@ -35,6 +63,132 @@ def _ensure_images_dir() -> None:
     IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
 
+def start_writer() -> None:
+    """
+    Start the background history writer.
+
+    Request handlers enqueue writes and return; a single task drains the queue and
+    commits up to WRITE_BATCH_SIZE writes per transaction, so requests do not wait
+    on SQLite commits and writes are never issued concurrently.
+    """
+    global _write_queue, _writer_task
+
+    if _writer_task is not None or not is_database_available():
+        return
+
+    _write_queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+    _writer_task = asyncio.create_task(_writer_loop(_write_queue))
+
+
+async def stop_writer() -> None:
+    """Flush queued writes and stop the background history writer."""
+    global _write_queue, _writer_task
+
+    if _writer_task is None or _write_queue is None:
+        return
+
+    await _write_queue.join()
+    _writer_task.cancel()
+    try:
+        await _writer_task
+    except asyncio.CancelledError:
+        pass
+
+    _write_queue = None
+    _writer_task = None
+
+
+async def _writer_loop(queue: asyncio.Queue[_QueuedWrite]) -> None:
+    """Drain the write queue, committing each batch in one transaction."""
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < WRITE_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+
+        try:
+            await _apply_writes([(description, write) for description, write, _ in batch])
+        finally:
+            for _, _, committed in batch:
+                if not committed.done():
+                    committed.set_result(None)
+                queue.task_done()
+
+
+async def _commit_writes(writes: list[tuple[str, HistoryWrite]]) -> None:
+    """Apply writes in order and commit them together."""
+    session = get_session()
+    if session is None:
+        return
+
+    async with _write_lock, session:
+        for _, write in writes:
+            await write(session)
+        await session.commit()
+
+    for description, _ in writes:
+        logger.info(description)
+
+
+async def _apply_writes(writes: list[tuple[str, HistoryWrite]]) -> None:
+    """
+    Commit a batch of writes, logging instead of raising on failure.
+
+    If the batch cannot be committed, each write is retried in its own transaction
+    so that one bad write only loses itself rather than the whole batch.
+    """
+    try:
+        await _commit_writes(writes)
+        return
+    except Exception as e:
+        if len(writes) == 1:
+            logger.warning(f"Failed to write history update ({writes[0][0]}): {e}")
+            return
+        logger.warning(f"Failed to write {len(writes)} history updates, retrying singly: {e}")
+
+    for description, write in writes:
+        try:
+            await _commit_writes([(description, write)])
+        except Exception as e:
+            logger.warning(f"Failed to write history update ({description}): {e}")
+
+
+async def _submit(job_id: str, description: str, write: HistoryWrite) -> bool:
+    """
+    Queue a write for the background writer.
+
+    When the queue is full the write is dropped with a warning rather than holding
+    the request up until the writer catches up; history is best effort. Writes
+    in-line when the writer is not running.
+
+    Args:
+        job_id: Job the write belongs to
+        description: Log message emitted once the write is committed
+        write: Coroutine function applying the write to a session
+
+    Returns:
+        True if the write was queued or committed, False if it was dropped
+    """
+    if _write_queue is None:
+        await _commit_writes([(description, write)])
+        return True
+
+    committed = asyncio.get_running_loop().create_future()
+    try:
+        _write_queue.put_nowait((description, write, committed))
+    except asyncio.QueueFull:
+        logger.warning(f"History write queue full, dropping update ({description})")
+        return False
+
+    _pending_writes[job_id] = committed
+
+    def forget(_: asyncio.Future[None]) -> None:
+        if _pending_writes.get(job_id) is committed:
+            del _pending_writes[job_id]
+
+    committed.add_done_callback(forget)
+    return True
+
+
 async def create_job(filename: str) -> str | None:
     """
     Create a new processing job record.
@@ -48,98 +202,143 @@ async def create_job(filename: str) -> str | None:
     if not is_database_available():
         return None
 
-    session = get_session()
-    if session is None:
-        return None
+    job_id = str(uuid.uuid4())
+
+    async def write(session: AsyncSession) -> None:
+        session.add(ProcessingJob(id=job_id, filename=filename, status="processing"))
 
     try:
-        async with session:
-            job_id = str(uuid.uuid4())
-            job = ProcessingJob(
-                id=job_id,
-                filename=filename,
-                status="processing",
-                created_at=datetime.utcnow(),
-            )
-            session.add(job)
-            await session.commit()
-            logger.info(f"Created job {job_id} for {filename}")
-            return job_id
+        if not await _submit(job_id, f"Created job {job_id} for {filename}", write):
+            return None
+        return job_id
     except Exception as e:
         logger.warning(f"Failed to create job record: {e}")
         return None
 
 
+def _save_thumbnail(job_id: str, page_number: int, image: Image.Image | np.ndarray) -> str:
+    """
+    Save a page thumbnail to the job's image directory.
+
+    Args:
+        job_id: Job ID
+        page_number: Page number (1-indexed)
+        image: PIL Image or RGB array of the page
+
+    Returns:
+        Relative path for web serving
+    """
+    # Create job-specific directory
+    job_images_dir = IMAGES_DIR / job_id
+    job_images_dir.mkdir(parents=True, exist_ok=True)
+
+    # Save thumbnail
+    image_path = job_images_dir / f"page_{page_number}.webp"
+
+    # Resize maintaining aspect ratio
+    if isinstance(image, np.ndarray):
+        # Downscale the rendered page array directly and only wrap the small result
+        # in PIL, instead of copying the full-resolution page into a PIL image first
+        height, width = image.shape[:2]
+        new_height = int(THUMBNAIL_WIDTH * height / width)
+        thumbnail = Image.fromarray(
+            cv2.resize(image, (THUMBNAIL_WIDTH, new_height), interpolation=cv2.INTER_AREA)
+        )
+    else:
+        # resize() already returns a new image, and reducing_gap does a cheap box
+        # reduction first so LANCZOS runs on a much smaller intermediate instead of
+        # the full-resolution page.
+        aspect = image.height / image.width
+        new_height = int(THUMBNAIL_WIDTH * aspect)
+        thumbnail = image.resize(
+            (THUMBNAIL_WIDTH, new_height), Image.Resampling.LANCZOS, reducing_gap=3.0
+        )
+
+    # Convert to RGB if necessary (page scans carry no useful alpha)
+    if thumbnail.mode in ("RGBA", "P"):
+        thumbnail = thumbnail.convert("RGB")
+
+    # WebP is typically 25-40% smaller than baseline JPEG at the same visual quality
+    thumbnail.save(str(image_path), "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+
+    # Store relative path for web serving
+    return f"/static/images/{job_id}/page_{page_number}.webp"
+
+
 async def add_page(
     job_id: str,
     page_number: int,
-    image: Image.Image,
+    image: Image.Image | np.ndarray,
     text: str,
     confidence: float,
 ) -> bool:
     """
     Add a page record with thumbnail image.
 
+    Deprecated: use add_pages_bulk, which commits all pages of a job at once.
+
     Args:
         job_id: Job ID
         page_number: Page number (1-indexed)
-        image: PIL Image of the page
+        image: PIL Image or RGB array of the page
         text: Extracted text from the page
         confidence: Average confidence score
 
     Returns:
         True if successful, False if failed
     """
-    if not is_database_available():
-        return False
+    return await add_pages_bulk(job_id, [(page_number, image, text, confidence)])
 
-    session = get_session()
-    if session is None:
-        return False
-
-    try:
-        _ensure_images_dir()
-
-        # Create job-specific directory
-        job_images_dir = IMAGES_DIR / job_id
-        job_images_dir.mkdir(parents=True, exist_ok=True)
-
-        # Save thumbnail
-        image_path = job_images_dir / f"page_{page_number}.jpg"
-        thumbnail = image.copy()
 
-        # Resize maintaining aspect ratio
-        aspect = thumbnail.height / thumbnail.width
-        new_height = int(THUMBNAIL_WIDTH * aspect)
-        thumbnail = thumbnail.resize((THUMBNAIL_WIDTH, new_height), Image.Resampling.LANCZOS)
+async def add_pages_bulk(
+    job_id: str,
+    items: list[tuple[int, Image.Image | np.ndarray, str, float]],
+) -> bool:
+    """
+    Add page records with thumbnail images in a single transaction.
 
-        # Convert to RGB if necessary (for JPEG)
-        if thumbnail.mode in ("RGBA", "P"):
-            thumbnail = thumbnail.convert("RGB")
+    Args:
+        job_id: Job ID
+        items: List of (page_number, image, text, confidence) tuples
 
-        thumbnail.save(str(image_path), "JPEG", quality=THUMBNAIL_QUALITY)
+    Returns:
+        True if successful, False if failed
+    """
+    if not is_database_available():
+        return False
 
-        # Store relative path for web serving
-        relative_path = f"/static/images/{job_id}/page_{page_number}.jpg"
+    try:
+        _ensure_images_dir()
 
-        async with session:
-            page = ProcessingPage(
-                id=str(uuid.uuid4()),
-                job_id=job_id,
-                page_number=page_number,
-                image_path=relative_path,
-                text=text,
-                confidence=confidence,
-                created_at=datetime.utcnow(),
+        # Thumbnailing is CPU-bound (Pillow releases the GIL while resampling and
+        # encoding), so run it in worker threads instead of on the event loop.
+        relative_paths = await asyncio.gather(
+            *(
+                asyncio.to_thread(_save_thumbnail, job_id, page_number, image)
+                for page_number, image, _, _ in items
+            )
+        )
+
+        pages: list[ProcessingPage] = []
+        for (page_number, _, text, confidence), relative_path in zip(items, relative_paths):
+            pages.append(
+                ProcessingPage(
+                    id=str(uuid.uuid4()),
+                    job_id=job_id,
+                    page_number=page_number,
+                    image_path=relative_path,
+                    text=text,
+                    confidence=confidence,
+                )
             )
-            session.add(page)
-            await session.commit()
 
-        logger.debug(f"Added page {page_number} to job {job_id}")
-        return True
+        async def write(session: AsyncSession) -> None:
+            session.add_all(pages)
+
+        return await _submit(job_id, f"Added {len(pages)} pages to job {job_id}", write)
 
     except Exception as e:
-        logger.warning(f"Failed to add page {page_number} to job {job_id}: {e}")
+        logger.warning(f"Failed to add pages to job {job_id}: {e}")
         return False
 
 
@@ -158,27 +357,20 @@ async def complete_job(job_id: str, full_text: str, total_pages: int) -> bool:
     if not is_database_available():
         return False
 
-    session = get_session()
-    if session is None:
-        return False
-
-    try:
-        async with session:
-            result = await session.execute(
-                select(ProcessingJob).where(ProcessingJob.id == job_id)
+    async def write(session: AsyncSession) -> None:
+        await session.execute(
+            update(ProcessingJob)
+            .where(ProcessingJob.id == job_id)
+            .values(
+                status="completed",
+                full_text=full_text,
+                total_pages=total_pages,
+                completed_at=func.now(),
             )
-            job = result.scalar_one_or_none()
-
-            if job:
-                job.status = "completed"
-                job.full_text = full_text
-                job.total_pages = total_pages
-                job.completed_at = datetime.utcnow()
-                await session.commit()
-                logger.info(f"Job {job_id} completed with {total_pages} pages")
-                return True
+        )
 
-        return False
+    try:
+        return await _submit(job_id, f"Job {job_id} completed with {total_pages} pages", write)
 
     except Exception as e:
         logger.warning(f"Failed to complete job {job_id}: {e}")
@@ -199,36 +391,49 @@ async def fail_job(job_id: str, error_message: str) -> bool:
     if not is_database_available():
         return False
 
-    session = get_session()
-    if session is None:
-        return False
+    async def write(session: AsyncSession) -> None:
+        await session.execute(
+            update(ProcessingJob)
+            .where(ProcessingJob.id == job_id)
+            .values(status="failed", error_message=error_message, completed_at=func.now())
+        )
 
     try:
-        async with session:
-            result = await session.execute(
-                select(ProcessingJob).where(ProcessingJob.id == job_id)
-            )
-            job = result.scalar_one_or_none()
-
-            if job:
-                job.status = "failed"
-                job.error_message = error_message
-                job.completed_at = datetime.utcnow()
-                await session.commit()
-                logger.info(f"Job {job_id} marked as failed: {error_message}")
-                return True
-
-        return False
+        return await _submit(job_id, f"Job {job_id} marked as failed: {error_message}", write)
 
     except Exception as e:
         logger.warning(f"Failed to mark job {job_id} as failed: {e}")
         return False
 
 
+def _filename_filter(search: str) -> Any:
+    """
+    Build a filename substring filter.
+
+    Uses the trigram FTS5 index when available. Falls back to ILIKE for terms the
+    index cannot answer (shorter than a trigram, or containing LIKE wildcards).
+
+    Args:
+        search: Filename search query
+
+    Returns:
+        SQLAlchemy filter clause
+    """
+    if database.fts_available and len(search) >= 3 and not any(c in search for c in "%_"):
+        # Quote as an FTS5 string so the term is matched literally
+        phrase = '"' + search.replace('"', '""') + '"'
+        return text(
+            f"processing_jobs.rowid IN (SELECT rowid FROM {database.FTS_TABLE} "
+            f"WHERE {database.FTS_TABLE} MATCH :phrase)"
+        ).bindparams(phrase=phrase)
+    return ProcessingJob.filename.ilike(f"%{search}%")
+
+
 async def get_jobs(
     page: int = 1,
     limit: int = 20,
     search: str | None = None,
+    status: str | None = None,
 ) -> dict[str, Any]:
     """
     Get paginated list of jobs.
@@ -237,6 +442,7 @@ async def get_jobs(
         page: Page number (1-indexed)
         limit: Number of items per page
         search: Optional filename search query
+        status: Optional status filter (processing, completed, failed)
 
     Returns:
         Dictionary with jobs list and pagination info
@@ -244,31 +450,41 @@ async def get_jobs(
     if not is_database_available():
         return {"jobs": [], "total": 0, "page": page, "limit": limit, "pages": 0}
 
-    session = get_session()
-    if session is None:
+    count_session = get_session()
+    data_session = get_session()
+    if count_session is None or data_session is None:
         return {"jobs": [], "total": 0, "page": page, "limit": limit, "pages": 0}
 
     try:
-        async with session:
-            # Build query
-            query = select(ProcessingJob)
-
+        async with count_session, data_session:
+            # Build filters
+            filters = []
+            if status:
+                filters.append(ProcessingJob.status == status)
             if search:
-                query = query.where(ProcessingJob.filename.ilike(f"%{search}%"))
+                filters.append(_filename_filter(search))
 
-            # Get total count
-            count_query = select(func.count()).select_from(query.subquery())
-            total_result = await session.execute(count_query)
-            total = total_result.scalar() or 0
+            # Count directly on the table rather than over a materialized subquery
+            count_query = select(func.count()).select_from(ProcessingJob).where(*filters)
 
-            # Get paginated results
             offset = (page - 1) * limit
-            query = query.order_by(desc(ProcessingJob.created_at)).offset(offset).limit(limit)
-            result = await session.execute(query)
-            jobs = result.scalars().all()
+            data_query = (
+                select(*ProcessingJob.summary_columns())
+                .where(*filters)
+                .order_by(desc(ProcessingJob.created_at))
+                .offset(offset)
+                .limit(limit)
+            )
+
+            # Run count and page fetch concurrently on separate pooled connections
+            total_result, result = await asyncio.gather(
+                count_session.execute(count_query), data_session.execute(data_query)
+            )
+            total = total_result.scalar() or 0
+            rows = result.all()
 
             return {
-                "jobs": [job.to_dict() for job in jobs],
+                "jobs": [ProcessingJob.to_summary_dict(row) for row in rows],
                 "total": total,
                 "page": page,
                 "limit": limit,
@@ -299,25 +515,21 @@ async def get_job(job_id: str) -> dict[str, Any] | None:
 
     try:
         async with session:
-            # Get job
+            # Get job with its pages eagerly loaded
             result = await session.execute(
-                select(ProcessingJob).where(ProcessingJob.id == job_id)
+                select(ProcessingJob)
+                .options(selectinload(ProcessingJob.pages))
+                .where(ProcessingJob.id == job_id)
             )
             job = result.scalar_one_or_none()
 
             if not job:
                 return None
 
-            # Get pages
-            pages_result = await session.execute(
-                select(ProcessingPage)
-                .where(ProcessingPage.job_id == job_id)
-                .order_by(ProcessingPage.page_number)
-            )
-            pages = pages_result.scalars().all()
-
             job_dict = job.to_dict()
-            job_dict["pages"] = [page.to_dict() for page in pages]
+            job_dict["pages"] = [
+                page.to_dict() for page in sorted(job.pages, key=lambda p: p.page_number)
+            ]
             return job_dict
 
     except Exception as e:
@@ -329,6 +541,10 @@ async def delete_job(job_id: str) -> bool:
     """
     Delete a job and its associated images.
 
+    Waits for the job's own queued writes first, so a job whose creation, pages or
+    completion are still waiting for the background writer is deleted in full
+    rather than reported missing or left with pages inserted after it was deleted.
+
     Args:
         job_id: Job ID
 
@@ -338,12 +554,16 @@ async def delete_job(job_id: str) -> bool:
     if not is_database_available():
         return False
 
+    pending = _pending_writes.get(job_id)
+    if pending is not None:
+        await asyncio.shield(pending)
+
     session = get_session()
     if session is None:
         return False
 
     try:
-        async with session:
+        async with _write_lock, session:
             # Get job
             result = await session.execute(
                 select(ProcessingJob).where(ProcessingJob.id == job_id)
@@ -353,14 +573,16 @@ async def delete_job(job_id: str) -> bool:
             if not job:
                 return False
 
+            # Delete images directory in a worker thread while the row is deleted
+            rmtree_task = asyncio.create_task(
+                asyncio.to_thread(shutil.rmtree, IMAGES_DIR / job_id, ignore_errors=True)
+            )
+
             # Delete from database (cascades to pages)
             await session.delete(job)
             await session.commit()
 
-        # Delete images directory
-        job_images_dir = IMAGES_DIR / job_id
-        if job_images_dir.exists():
-            shutil.rmtree(job_images_dir)
+        await rmtree_task
 
         logger.info(f"Deleted job {job_id}")
         return True
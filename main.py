@@ -4,29 +4,42 @@ OCR Service - FastAPI application for processing PDFs with OCR.
 Uses docTR for accurate text extraction and PyMuPDF for creating searchable PDFs.
 Includes processing history tracking with web UI dashboard.
 """
+import asyncio
+import gc
 import logging
+import multiprocessing
 import os
 import shutil
+import sys
 import tempfile
+from collections import deque
 from collections.abc import AsyncGenerator, Awaitable, Callable
-from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import AbstractContextManager, asynccontextmanager, nullcontext
+from itertools import repeat
 from pathlib import Path
-from typing import Any
+from typing import IO, Any, cast
 
 import cv2
-import fitz
 import numpy as np
-from doctr.io import DocumentFile
+import doctr
+import torch
+from doctr.io.elements import Document
 from doctr.models import ocr_predictor
+from doctr.models.preprocessor import PreProcessor
 from fastapi import BackgroundTasks, FastAPI, File, HTTPException, Query, Request, UploadFile
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from PIL import Image
-import statistics
 
 import database
 import history_service
+import pdf_renderer
+import pdf_text_layer
+import result_cache
+from fused_preprocessor import FusedPreProcessor
+from padded_batch import PaddedBatch, halving_batch_sizes
+from pinned_transfer import PinnedPreProcessor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -34,12 +47,80 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+MAX_REQUEST_OVERHEAD = 64 * 1024  # Multipart boundaries and part headers around the file
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB
 MIN_DPI = 72
 MAX_DPI = 600
 DEFAULT_DPI = 300
+# Per-request working files (uploads, output PDFs) live here; the default is a
+# memory-backed tmpfs so they never touch the disk
+TEMP_DIR = os.getenv("TEMP_DIR", "/dev/shm/ocr-service")
+# Free space TEMP_DIR needs: the spooled upload, its input.pdf copy and the output
+# PDF of a maximum size request. Docker's default 64MB /dev/shm falls short.
+TEMP_DIR_MIN_FREE = 3 * MAX_FILE_SIZE
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+# Default cap on the longer side of pages rendered for /extract-text. docTR detects
+# on a 1024px resize but recognizes word crops taken from the page itself, so
+# ~2048px (about 175 DPI on A4) keeps body text legible while rendering about a
+# third of the pixels of a 300 DPI page
+EXTRACT_MAX_SIDE = 2048
+# Longer side of the page images kept for history thumbnails: pages read from their
+# own text layer are rendered at this size, OCR'd pages are shrunk to it after OCR
+PREVIEW_SIDE = 600
+# API documentation of the endpoints' `preprocess` option
+PREPROCESS_DESCRIPTION = (
+    "Denoise pages with OpenCV before OCR. Only helps with photos of documents: docTR "
+    "already normalizes its input and reads rendered PDF pages best as they are."
+)
+# docTR calls allowed to run at once across all requests; more than one per device
+# mostly adds memory pressure, so the default runs one inference at a time
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "1"))
+# docTR batch sizes: pages per detection forward pass, word crops per recognition pass
+OCR_DET_BATCH_SIZE = int(os.getenv("OCR_DET_BATCH_SIZE", "2"))
+OCR_RECO_BATCH_SIZE = int(os.getenv("OCR_RECO_BATCH_SIZE", "128"))
+# Pages per pipeline chunk: OCR of one chunk overlaps rendering of the next ones.
+# A multiple of the detection batch size, so only the last chunk has a short batch.
+OCR_CHUNK_PAGES = 2 * OCR_DET_BATCH_SIZE
+# Chunks rendered ahead of OCR; bounds the full-size pages held at once
+OCR_RENDER_AHEAD = 2
+OCR_COMPILE = os.getenv("OCR_COMPILE", "false").lower() in ("1", "true", "yes")
+# torch.compile mode: "reduce-overhead" (CUDA graphs on GPU), "max-autotune" (also
+# benchmarks kernel choices; much slower startup) or "default"
+OCR_COMPILE_MODE = os.getenv("OCR_COMPILE_MODE", "reduce-overhead")
+# Inference precision: fp32, fp16 or bf16 (default: fp16 on GPU, fp32 on CPU)
+OCR_PRECISION = os.getenv("OCR_PRECISION", "").lower()
+# docTR detection and recognition architectures (docTR's defaults)
+OCR_DET_ARCH = "db_resnet50"
+OCR_RECO_ARCH = "crnn_vgg16_bn"
+# Inference engine for the docTR backbones: "pytorch", or "tensorrt" on GPU (needs
+# the optional torch-tensorrt package; falls back to PyTorch when unavailable)
+OCR_ENGINE = os.getenv("OCR_ENGINE", "pytorch").lower()
+# Built TensorRT engines are cached here, per GPU architecture
+# With TensorRT, recognition batches are padded to OCR_RECO_BATCH_SIZE or one of its
+# halves down to this size, one engine each, so sparse pages don't pay for a full batch
+TRT_MIN_RECO_BATCH_SIZE = 16
+TRT_ENGINE_CACHE_DIR = os.getenv("TRT_ENGINE_CACHE_DIR", "data/trt-engines")
+OCR_PRELOAD = os.getenv("OCR_PRELOAD", "false").lower() in ("1", "true", "yes")
 
 # OCR model storage
 ocr_model: Any = None
+ocr_on_gpu: bool = False
+ocr_dtype: torch.dtype = torch.float32
+# Everything about the loaded model that changes its output, part of result cache keys
+ocr_config: tuple[object, ...] = ()
+
+_OCR_DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
+
+# Process pool for PDF rasterization (None renders in-process)
+render_executor: ProcessPoolExecutor | None = None
+
+# Threads running OCR; the pool size bounds concurrent model calls, extra chunks queue
+ocr_executor = ThreadPoolExecutor(max_workers=OCR_CONCURRENCY, thread_name_prefix="ocr")
+
+# Threads preprocessing pages; OpenCV releases the GIL, so pages run on all cores
+preprocess_executor = ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 4, thread_name_prefix="preprocess"
+)
 
 # Templates
 templates = Jinja2Templates(directory="templates")
@@ -48,29 +129,298 @@ templates = Jinja2Templates(directory="templates")
 Path("static").mkdir(parents=True, exist_ok=True)
 
 
+def load_ocr_model() -> Any:
+    """
+    Load the docTR predictor and move it to the GPU when one is available.
+
+    Precision follows OCR_PRECISION. On GPU the weights are cast to FP16 or BF16:
+    docTR casts each input batch to the model's dtype, so that is enough to run the
+    CNNs on tensor cores (BF16 keeps FP32's exponent range, so it cannot overflow
+    where FP16 might). On CPU the weights stay FP32 and BF16 is applied through
+    autocast, which only pays off on CPUs with native BF16 (AVX512-BF16/AMX).
+
+    docTR resizes every input to fixed shapes (1024x1024 pages for detection,
+    32x128 crops for recognition); FusedPreProcessor does that resize together with
+    the normalization in a single pass per input. Because the shapes are fixed,
+    cuDNN autotuning results are reused across requests, and on GPU each
+    predictor's input batches are staged in a couple of preallocated pinned buffers
+    and copied asynchronously instead of from freshly allocated pageable memory.
+
+    Pages are batched OCR_DET_BATCH_SIZE at a time through detection and word crops
+    OCR_RECO_BATCH_SIZE at a time through recognition; larger batches keep a GPU
+    busier at the cost of memory.
+
+    Returns:
+        docTR OCR predictor
+
+    Raises:
+        ValueError: If OCR_PRECISION is not supported on the selected device
+    """
+    global ocr_on_gpu, ocr_dtype, ocr_config
+
+    ocr_on_gpu = torch.cuda.is_available()
+    precision = OCR_PRECISION or ("fp16" if ocr_on_gpu else "fp32")
+    if precision not in _OCR_DTYPES or (precision == "fp16" and not ocr_on_gpu):
+        raise ValueError(f"Unsupported OCR_PRECISION {precision!r} on this device")
+    ocr_dtype = _OCR_DTYPES[precision]
+
+    model = ocr_predictor(
+        det_arch=OCR_DET_ARCH,
+        reco_arch=OCR_RECO_ARCH,
+        pretrained=True,
+        det_bs=OCR_DET_BATCH_SIZE,
+        reco_bs=OCR_RECO_BATCH_SIZE,
+    )
+    # Resize and normalize inputs in one pass instead of docTR's several. The
+    # wrapper stands in for the PreProcessor the predictors are annotated with.
+    for predictor in (model.det_predictor, model.reco_predictor):
+        predictor.pre_processor = cast(PreProcessor, FusedPreProcessor(predictor.pre_processor))
+    if ocr_on_gpu:
+        torch.backends.cudnn.benchmark = True
+        model = model.cuda().to(dtype=ocr_dtype)
+        # Stage input batches in reusable pinned buffers for async host-to-GPU copies
+        for predictor in (model.det_predictor, model.reco_predictor):
+            predictor.pre_processor = cast(
+                PreProcessor, PinnedPreProcessor(predictor.pre_processor, ocr_dtype)
+            )
+    logger.info(f"OCR model running on {'GPU' if ocr_on_gpu else 'CPU'} ({precision.upper()})")
+    engine = "pytorch"
+    if OCR_ENGINE == "tensorrt" and tensorrt_available():
+        compile_backbones(model, pad_batches=True, **tensorrt_compile_options())
+        logger.info("OCR backbones compiled with TensorRT")
+        engine = "tensorrt"
+    elif OCR_COMPILE:
+        compile_backbones(model, mode=OCR_COMPILE_MODE)
+        logger.info(f"OCR backbones compiled with torch.compile (mode={OCR_COMPILE_MODE})")
+        engine = f"compile-{OCR_COMPILE_MODE}"
+    ocr_config = (
+        doctr.__version__,
+        OCR_DET_ARCH,
+        OCR_RECO_ARCH,
+        precision,
+        engine,
+        OCR_DET_BATCH_SIZE,
+        OCR_RECO_BATCH_SIZE,
+        FusedPreProcessor.__name__,
+    )
+    return model
+
+
+def compile_backbones(model: Any, pad_batches: bool = False, **options: Any) -> None:
+    """
+    Compile the CNN backbones of both docTR predictors with torch.compile.
+
+    Only the backbones are compiled: the models' own forward() mixes in numpy
+    post-processing that TorchDynamo cannot trace.
+
+    Args:
+        model: docTR OCR predictor
+        pad_batches: Pad short batches to the full detection batch size, and to the
+            recognition batch size or one of its halves, for backends that compile
+            for fixed input shapes
+        options: Keyword arguments for torch.compile
+    """
+    for predictor, batch_sizes in (
+        (model.det_predictor, [OCR_DET_BATCH_SIZE]),
+        (
+            model.reco_predictor,
+            halving_batch_sizes(OCR_RECO_BATCH_SIZE, TRT_MIN_RECO_BATCH_SIZE),
+        ),
+    ):
+        compiled = torch.compile(predictor.model.feat_extractor, **options)
+        if pad_batches:
+            compiled = PaddedBatch(compiled, batch_sizes)
+        predictor.model.feat_extractor = compiled
+
+
+def uncompile_backbones(model: Any) -> None:
+    """Restore the eager backbones replaced by compile_backbones()."""
+    for predictor in (model.det_predictor, model.reco_predictor):
+        backbone = predictor.model.feat_extractor
+        if isinstance(backbone, PaddedBatch):
+            backbone = backbone.module
+        predictor.model.feat_extractor = getattr(backbone, "_orig_mod", backbone)
+
+
+def tensorrt_available() -> bool:
+    """Check whether the TensorRT engine can be used, logging why if not."""
+    if not ocr_on_gpu:
+        logger.warning("OCR_ENGINE=tensorrt needs a GPU, using PyTorch")
+        return False
+    try:
+        # Optional dependency; importing it registers the "tensorrt" compile backend
+        import torch_tensorrt  # noqa: F401  # pyright: ignore[reportMissingImports]
+    except ImportError:
+        logger.warning("OCR_ENGINE=tensorrt needs the torch-tensorrt package, using PyTorch")
+        return False
+    return True
+
+
+def tensorrt_compile_options() -> dict[str, Any]:
+    """
+    torch.compile arguments that build TensorRT engines for the backbones.
+
+    Engines are built for static shapes, in the model's precision so FP16/BF16
+    run on tensor cores. docTR resizes every input to a fixed page or crop size,
+    and compile_backbones(pad_batches=True) pads short batches (the last pages of a
+    chunk, pages with fewer words than a recognition batch) to a few fixed batch
+    sizes, so the startup warmup builds every engine ever used. Engines
+    only suit the GPU architecture they were built on, so the engine cache is split
+    by compute capability.
+    """
+    major, minor = torch.cuda.get_device_capability()
+    return {
+        "backend": "tensorrt",
+        "dynamic": False,
+        "options": {
+            "enabled_precisions": {ocr_dtype},
+            "min_block_size": 1,
+            "cache_built_engines": True,
+            "reuse_cached_engines": True,
+            "engine_cache_dir": str(Path(TRT_ENGINE_CACHE_DIR) / f"sm{major}{minor}"),
+        },
+    }
+
+
+def warmup_ocr_model(model: Any) -> None:
+    """
+    Run a synthetic page through the predictor.
+
+    Moves one-off costs (torch.compile codegen, cuDNN autotuning, allocator growth)
+    from the first request to startup. The page carries a line of text so the
+    recognition model runs too, not only detection. A full detection batch is run,
+    since that is the input shape OCR chunks use and cuDNN autotuning and compiled
+    graphs are specific to it. It is run twice: in "reduce-overhead" mode the first
+    call only compiles, and CUDA graphs are recorded on the next one. A recognition
+    backbone padded to several batch sizes then gets one batch of crops per size.
+
+    Args:
+        model: docTR OCR predictor
+    """
+    page = np.full((1024, 1024, 3), 255, dtype=np.uint8)
+    cv2.putText(page, "OCR warmup", (100, 512), cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 0, 0), 6)
+    with ocr_inference_context():
+        for _ in range(2):
+            model([page] * OCR_DET_BATCH_SIZE)
+        backbone = model.reco_predictor.model.feat_extractor
+        if isinstance(backbone, PaddedBatch):
+            crop = page[400:550, 80:950]
+            for batch_size in backbone.batch_sizes:
+                model.reco_predictor([crop] * batch_size)
+
+
+def ocr_inference_context() -> AbstractContextManager[Any]:
+    """Autocast context for OCR inference at the configured precision (no-op for FP32)."""
+    if ocr_dtype is torch.float32:
+        return nullcontext()
+    return torch.autocast("cuda" if ocr_on_gpu else "cpu", dtype=ocr_dtype)
+
+
+def configure_temp_dir() -> None:
+    """
+    Make TEMP_DIR the default directory for temporary files.
+
+    This covers the per-request working directories as well as uploads that
+    outgrow their in-memory spool. If TEMP_DIR cannot be created or written to
+    (no /dev/shm, or a read-only mount), or has less than TEMP_DIR_MIN_FREE bytes
+    free, the OS default is kept.
+    """
+    try:
+        Path(TEMP_DIR).mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"Temporary directory {TEMP_DIR} unavailable ({e}), using the default")
+        return
+    if not os.access(TEMP_DIR, os.W_OK | os.X_OK):
+        logger.warning(f"Temporary directory {TEMP_DIR} is not writable, using the default")
+        return
+    free = shutil.disk_usage(TEMP_DIR).free
+    if free < TEMP_DIR_MIN_FREE:
+        logger.warning(
+            f"Temporary directory {TEMP_DIR} has only {free / (1024*1024):.0f}MB free, "
+            f"less than the {TEMP_DIR_MIN_FREE / (1024*1024):.0f}MB a maximum size upload "
+            "needs, using the default (increase --shm-size or set TEMP_DIR)"
+        )
+        return
+    tempfile.tempdir = TEMP_DIR
+    logger.info(f"Using {TEMP_DIR} for temporary files")
+
+
+# Load the model at import time when preloading, so a pre-forking server
+# (gunicorn --preload) loads it once in the master and workers share the weight
+# pages copy-on-write instead of each loading their own copy. Not on GPU: a CUDA
+# context does not survive fork, so there each worker loads the model in lifespan
+# (torch.cuda.is_available() does not create a context itself).
+if OCR_PRELOAD:
+    if torch.cuda.is_available():
+        logger.warning(
+            "OCR_PRELOAD ignored: a CUDA device is visible and CUDA does not survive "
+            "fork, so each worker loads the model at startup"
+        )
+    else:
+        logger.info("Preloading docTR OCR model...")
+        ocr_model = load_ocr_model()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """Lifespan context manager for startup and shutdown events."""
-    global ocr_model
+    global ocr_model, render_executor
 
-    # Initialize OCR model
-    logger.info("Loading docTR OCR model...")
-    ocr_model = ocr_predictor(pretrained=True)
+    # Initialize OCR model (already loaded when preloaded before fork)
+    if ocr_model is None:
+        logger.info("Loading docTR OCR model...")
+        ocr_model = load_ocr_model()
+    if OCR_COMPILE or ocr_on_gpu:
+        try:
+            warmup_ocr_model(ocr_model)
+        except Exception as e:
+            if OCR_ENGINE != "tensorrt":
+                raise
+            # The engines are built on the first call; keep serving with PyTorch
+            logger.warning(f"TensorRT engine build failed ({e}), using PyTorch")
+            uncompile_backbones(ocr_model)
+            warmup_ocr_model(ocr_model)
+    # Move the model and everything allocated while loading it into the permanent
+    # generation, so later full collections no longer traverse those objects. Cyclic
+    # garbage from loading and warmup (e.g. compile artifacts) is collected first,
+    # since frozen objects are never freed.
+    gc.collect()
+    gc.freeze()
     logger.info("OCR model loaded successfully")
 
     # Initialize database (non-blocking - app works without it)
     db_available = await database.init_database()
     if db_available:
+        history_service.start_writer()
         logger.info("History database initialized")
     else:
         logger.warning("History database unavailable - history will not be recorded")
 
     # Ensure static directories exist
     Path("static/images").mkdir(parents=True, exist_ok=True)
+    configure_temp_dir()
+
+    # Start render workers. "spawn" keeps children from inheriting the loaded model
+    # and the event loop's threads; they only import the PyMuPDF modules (main.py
+    # is never the launching script, see serve.py, so spawn never re-runs it). The pool
+    # lives for the whole app, and one no-op task makes it start its workers now
+    # rather than on the first request.
+    if RENDER_WORKERS > 1:
+        render_executor = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=pdf_renderer.init_worker,
+        )
+        await asyncio.get_running_loop().run_in_executor(render_executor, os.getpid)
+        logger.info(f"Started {RENDER_WORKERS} PDF render workers")
 
     yield
 
     # Cleanup
+    if render_executor is not None:
+        render_executor.shutdown(cancel_futures=True)
+        render_executor = None
+    await history_service.stop_writer()
     await database.close_database()
     logger.info("Shutting down OCR service")
 
@@ -87,6 +437,28 @@ app = FastAPI(
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
+@app.middleware("http")
+async def limit_request_size(
+    request: Request, call_next: Callable[[Request], Awaitable[Any]]
+) -> Any:
+    """
+    Reject oversized uploads by their Content-Length before the body is read.
+
+    The form parser spools the whole body to disk before an endpoint runs, so the
+    size check in save_upload_file only fires once an oversized upload has been
+    received. Chunked uploads without a Content-Length still rely on that check.
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MAX_FILE_SIZE + MAX_REQUEST_OVERHEAD:
+        return JSONResponse(
+            status_code=413,
+            content={
+                "detail": f"File too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB"
+            },
+        )
+    return await call_next(request)
+
+
 @app.middleware("http")
 async def add_security_headers(
     request: Request, call_next: Callable[[Request], Awaitable[Any]]
@@ -165,18 +537,20 @@ async def api_get_history(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
     q: str | None = Query(None),
-) -> dict[str, Any]:
+    status: str | None = Query(None),
+) -> ORJSONResponse:
     """Get paginated processing history."""
-    return await history_service.get_jobs(page=page, limit=limit, search=q)
+    result = await history_service.get_jobs(page=page, limit=limit, search=q, status=status)
+    return ORJSONResponse(content=result)
 
 
 @app.get("/api/history/{job_id}")
-async def api_get_job(job_id: str) -> JSONResponse:
+async def api_get_job(job_id: str) -> ORJSONResponse:
     """Get a single job with its pages."""
     job = await history_service.get_job(job_id)
     if job is None:
-        return JSONResponse(status_code=404, content={"error": "Job not found"})
-    return JSONResponse(content=job)
+        return ORJSONResponse(status_code=404, content={"error": "Job not found"})
+    return ORJSONResponse(content=job)
 
 
 @app.get("/history/{job_id}/detail", response_class=HTMLResponse)
@@ -232,12 +606,18 @@ def validate_dpi(dpi: int) -> int:
     return dpi
 
 
-async def save_upload_file(upload_file: UploadFile, destination: Path) -> int:
+def _copy_upload(source: IO[bytes], destination: Path) -> int:
     """
-    Save uploaded file and validate size.
+    Copy a spooled upload to disk, enforcing MAX_FILE_SIZE.
+
+    The request body has been fully spooled by the time the endpoint runs, so the
+    size is checked before anything is copied, and a copy that fails part way is
+    removed. Uploads Starlette has rolled over to
+    a temporary file are copied in the kernel with sendfile (Linux), smaller
+    in-memory ones in bounded chunks.
 
     Args:
-        upload_file: The uploaded file
+        source: Spooled upload file object
         destination: Path to save the file
 
     Returns:
@@ -246,119 +626,235 @@ async def save_upload_file(upload_file: UploadFile, destination: Path) -> int:
     Raises:
         HTTPException: If file is too large
     """
-    file_size = 0
-    with open(destination, "wb") as f:
-        while True:
-            chunk = await upload_file.read(1024 * 1024)  # Read 1MB at a time
-            if not chunk:
-                break
-            file_size += len(chunk)
-            if file_size > MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"File too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB",
-                )
-            f.write(chunk)
+    file_size = source.seek(0, os.SEEK_END)
+    source.seek(0)
+    if file_size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB",
+        )
+
+    try:
+        # Unbuffered: chunks are large, so BufferedWriter would only add a copy
+        with open(destination, "wb", buffering=0) as f:
+            # Same check Starlette uses: SpooledTemporaryFile sets _rolled once on disk
+            if sys.platform.startswith("linux") and getattr(source, "_rolled", False):
+                in_fd, out_fd = source.fileno(), f.fileno()
+                offset = 0
+                while offset < file_size:
+                    sent = os.sendfile(out_fd, in_fd, offset, file_size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+            else:
+                shutil.copyfileobj(source, f, UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        # e.g. the temp filesystem filled up; don't leave a truncated PDF behind
+        destination.unlink(missing_ok=True)
+        raise
     return file_size
 
 
-def cleanup_file(filepath: str) -> None:
+async def save_upload_file(upload_file: UploadFile, destination: Path) -> int:
     """
-    Background task to clean up temporary files.
+    Save uploaded file and validate size.
+
+    The copy runs in a worker thread straight from the spooled upload file, so
+    the event loop never blocks on disk I/O and memory use stays bounded to one
+    chunk regardless of PDF size.
 
     Args:
-        filepath: Path to the file to delete
+        upload_file: The uploaded file
+        destination: Path to save the file
+
+    Returns:
+        Size of the file in bytes
+
+    Raises:
+        HTTPException: If file is too large
     """
-    try:
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            logger.info(f"Cleaned up temporary file: {filepath}")
-    except Exception as e:
-        logger.error(f"Error cleaning up file {filepath}: {e}")
+    return await asyncio.to_thread(_copy_upload, upload_file.file, destination)
 
 
-def pdf_to_images(pdf_path: str, dpi: int = DEFAULT_DPI) -> list[Image.Image]:
+async def ocr_pdf(
+    pdf_path: str,
+    page_numbers: list[int],
+    dpi: int = DEFAULT_DPI,
+    preprocess: bool = False,
+    max_side: int | None = None,
+    heavy_denoise: bool = False,
+    binarize: bool = False,
+) -> tuple[list[np.ndarray], Any, list[tuple[int, int]]]:
     """
-    Convert PDF pages to PIL images using PyMuPDF.
+    Render PDF pages and run OCR on them as an overlapping pipeline.
+
+    The pages are split into chunks of OCR_CHUNK_PAGES. Up to OCR_RENDER_AHEAD
+    chunks are rendered ahead (in the render worker pool when available, otherwise
+    in a thread), and each chunk is OCR'd on the OCR executor as soon as it is
+    rendered, so rasterization of later pages overlaps inference on earlier ones
+    instead of adding to it. Once a chunk is OCR'd its pages are only kept at
+    PREVIEW_SIDE, for history thumbnails, so a long document never holds more than
+    a few chunks of full-size pages.
 
     Args:
         pdf_path: Path to the PDF file
+        page_numbers: Indices (0-based) of the pages to OCR, in order
         dpi: Resolution for image conversion
+        preprocess: Whether to apply OpenCV preprocessing
+        max_side: Optional cap on the longer side of rendered pages, in pixels
+        heavy_denoise: Use Non-Local Means denoising when preprocessing
+        binarize: Apply adaptive thresholding when preprocessing
 
     Returns:
-        List of PIL Image objects
+        Tuple of (HxWx3 page previews, docTR result with page_idx set to the
+        document page indices, list of rendered page dimensions)
     """
     logger.info(f"Converting PDF to images at {dpi} DPI")
-    images: list[Image.Image] = []
     zoom = dpi / 72  # PyMuPDF default is 72 DPI
 
-    doc = fitz.open(pdf_path)
-    try:
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            # Create transformation matrix for desired DPI
-            mat = fitz.Matrix(zoom, zoom)
-            # Render page to pixmap
-            pix = page.get_pixmap(matrix=mat)
-            # Convert to PIL Image
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            images.append(img)
-    finally:
-        doc.close()
-
-    logger.info(f"Converted {len(images)} pages to images")
-    return images
+    loop = asyncio.get_running_loop()
+    chunk_pages = [
+        page_numbers[start : start + OCR_CHUNK_PAGES]
+        for start in range(0, len(page_numbers), OCR_CHUNK_PAGES)
+    ]
 
+    def render(numbers: list[int]) -> asyncio.Future[list[np.ndarray]]:
+        return loop.run_in_executor(
+            render_executor, pdf_renderer.render_pages, pdf_path, numbers, zoom, max_side
+        )
 
-def preprocess_image_for_ocr(image: Image.Image) -> Image.Image:
+    renders = deque(render(numbers) for numbers in chunk_pages[:OCR_RENDER_AHEAD])
+    images: list[np.ndarray] = []
+    pages: list[Any] = []
+    dimensions: list[tuple[int, int]] = []
+    try:
+        for chunk_idx, numbers in enumerate(chunk_pages):
+            chunk_images = await renders.popleft()
+            # A render slot is free again: start on the next chunk waiting for one
+            if chunk_idx + OCR_RENDER_AHEAD < len(chunk_pages):
+                renders.append(render(chunk_pages[chunk_idx + OCR_RENDER_AHEAD]))
+            chunk_result, chunk_dimensions = await loop.run_in_executor(
+                ocr_executor,
+                run_ocr_on_images,
+                chunk_images,
+                preprocess,
+                heavy_denoise,
+                binarize,
+            )
+            previews = await asyncio.to_thread(shrink_to_preview, chunk_images)
+            # Renumber pages from chunk-relative to document indices. docTR pages keep
+            # a reference to their input image, which is swapped for the preview too.
+            for page, page_idx, preview in zip(chunk_result.pages, numbers, previews):
+                page.page_idx = page_idx
+                page.page = preview
+                pages.append(page)
+            images.extend(previews)
+            dimensions.extend(chunk_dimensions)
+    finally:
+        # Don't leave queued renders running if OCR failed part way through
+        for pending in renders:
+            pending.cancel()
+
+    logger.info(f"Processed {len(images)} pages")
+    return images, Document(pages=pages), dimensions
+
+
+def shrink_to_preview(images: list[np.ndarray]) -> list[np.ndarray]:
+    """Downscale page arrays so their longer side is at most PREVIEW_SIDE."""
+    previews: list[np.ndarray] = []
+    for image in images:
+        height, width = image.shape[:2]
+        scale = PREVIEW_SIDE / max(height, width)
+        if scale < 1:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        previews.append(image)
+    return previews
+
+
+def preprocess_image_for_ocr(
+    img_array: np.ndarray, heavy_denoise: bool = False, binarize: bool = False
+) -> np.ndarray:
     """
     Preprocess image using OpenCV to improve OCR accuracy.
 
     Applies:
     - Grayscale conversion
-    - Noise reduction
-    - Adaptive thresholding for binarization
-    - Contrast enhancement
+    - Edge-preserving smoothing (bilateral filter, or Non-Local Means with heavy_denoise)
+    - Optionally, adaptive thresholding for binarization
+
+    docTR was trained on natural images and reads smoothed grayscale better than
+    binarized pages, so thresholding is off by default.
 
     Args:
-        image: PIL Image to preprocess
+        img_array: RGB page array to preprocess
+        heavy_denoise: Use Non-Local Means denoising, which is much slower but can
+            help on very noisy scans
+        binarize: Apply adaptive thresholding after denoising
 
     Returns:
-        Preprocessed PIL Image
+        Preprocessed RGB page array
     """
-    # Convert PIL to OpenCV format (numpy array)
-    img_array = np.array(image)
-
     # Convert to grayscale if needed
     if len(img_array.shape) == 3:
         gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
     else:
         gray = img_array
 
-    # Apply denoising
-    denoised = cv2.fastNlMeansDenoising(gray, None, h=10, templateWindowSize=7, searchWindowSize=21)
+    # Apply denoising, unless the page is already bilevel (e.g. a fax or a scan
+    # binarized by the scanner), where smoothing would only blur the glyph edges
+    if not is_bilevel(gray):
+        if heavy_denoise:
+            gray = cv2.fastNlMeansDenoising(
+                gray, None, h=10, templateWindowSize=7, searchWindowSize=21
+            )
+        else:
+            gray = cv2.bilateralFilter(gray, 5, 50, 50)
 
-    # Apply adaptive thresholding for better binarization
-    # This works better than Otsu for documents with varying lighting
-    binary = cv2.adaptiveThreshold(
-        denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-    )
+    if binarize:
+        # Adaptive thresholding works better than Otsu for documents with varying lighting
+        gray = cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+        )
 
     # Convert back to RGB for docTR (it expects color images)
-    rgb = cv2.cvtColor(binary, cv2.COLOR_GRAY2RGB)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+
+
+def is_bilevel(gray: np.ndarray, max_mid_tones: float = 0.02) -> bool:
+    """
+    Check whether a grayscale page is (nearly) black and white only.
+
+    A strided sample of the page is checked, which is plenty for this decision.
+
+    Args:
+        gray: Grayscale page array
+        max_mid_tones: Largest fraction of pixels allowed between near-black and
+            near-white
 
-    return Image.fromarray(rgb)
+    Returns:
+        True if at most `max_mid_tones` of the sampled pixels are mid-tones
+    """
+    sample = np.ascontiguousarray(gray[::4, ::4])
+    # Bounds as arrays: OpenCV's stubs do not accept the equivalent plain scalars
+    mid_tones = cv2.countNonZero(cv2.inRange(sample, np.array([17]), np.array([238])))
+    return mid_tones <= max_mid_tones * sample.size
 
 
 def run_ocr_on_images(
-    images: list[Image.Image], preprocess: bool = True
+    images: list[np.ndarray],
+    preprocess: bool = False,
+    heavy_denoise: bool = False,
+    binarize: bool = False,
 ) -> tuple[Any, list[tuple[int, int]]]:
     """
     Run docTR OCR on images.
 
     Args:
-        images: List of PIL Image objects
+        images: List of HxWx3 RGB page arrays
         preprocess: Whether to apply OpenCV preprocessing
+        heavy_denoise: Use Non-Local Means denoising when preprocessing
+        binarize: Apply adaptive thresholding when preprocessing
 
     Returns:
         Tuple of (docTR result object, list of image dimensions)
@@ -372,102 +868,194 @@ def run_ocr_on_images(
     logger.info(f"Running OCR on {len(images)} images (preprocess={preprocess})")
 
     # Store original dimensions for text positioning
-    dimensions = [(img.width, img.height) for img in images]
+    dimensions = [(img.shape[1], img.shape[0]) for img in images]
 
     # Optionally preprocess images
     if preprocess:
-        processed_images = [preprocess_image_for_ocr(img) for img in images]
+        processed_images = list(
+            preprocess_executor.map(
+                preprocess_image_for_ocr,
+                images,
+                repeat(heavy_denoise),
+                repeat(binarize),
+            )
+        )
     else:
         processed_images = images
 
-    # Save images to temporary files for docTR (it expects file paths)
-    temp_dir = tempfile.mkdtemp()
-    image_paths: list[str] = []
-    try:
-        for i, img in enumerate(processed_images):
-            img_path = os.path.join(temp_dir, f"page_{i}.png")
-            img.save(img_path, "PNG")
-            image_paths.append(img_path)
-
-        # Load images via docTR
-        doc = DocumentFile.from_images(image_paths)
-
-        # Run OCR
-        result = ocr_model(doc)
+    # docTR takes the HxWx3 uint8 arrays as they are, no encode/decode round trip
+    with ocr_inference_context():
+        result = ocr_model(processed_images)
 
-        logger.info("OCR completed successfully")
-        return result, dimensions
-
-    finally:
-        # Cleanup temp files
-        shutil.rmtree(temp_dir, ignore_errors=True)
+    logger.info("OCR completed successfully")
+    return result, dimensions
 
 
-def embed_text_layer(
-    input_pdf_path: str, output_pdf_path: str, ocr_result: Any, dimensions: list[tuple[int, int]]
+async def embed_text_layer(
+    input_pdf_path: str,
+    output_pdf_path: str,
+    ocr_data: dict[str, Any],
+    ocr_pages: list[int],
+    garbage: int = 1,
 ) -> None:
     """
     Embed invisible text layer into PDF using PyMuPDF.
 
-    The text is positioned according to bounding boxes from docTR OCR results.
-    Text is made invisible but selectable/searchable.
+    The text is positioned according to the word bounding boxes in the OCR data.
+    Only OCR'd pages get a text layer; pages that had their own keep it as it is.
+    Text is made invisible but selectable/searchable. The PDF is written by a
+    render worker process when the pool is running (otherwise in a thread), so it
+    doesn't compete for the GIL with inference and the event loop.
 
     Args:
         input_pdf_path: Path to input PDF
         output_pdf_path: Path to output PDF with text layer
-        ocr_result: docTR OCR result object
-        dimensions: List of (width, height) tuples for each page image
+        ocr_data: OCR data in the extract_ocr_data format for all pages
+        ocr_pages: Indices (0-based) of the pages that were OCR'd
+        garbage: PyMuPDF garbage collection level used when saving (0-4)
     """
     logger.info("Embedding text layer with PyMuPDF")
 
-    doc = fitz.open(input_pdf_path)
+    # The word dicts extract_ocr_data() built are reused as they are, so the docTR
+    # result is only walked once; it also holds the page images, so it is not sent
+    write_pages = set(ocr_pages)
+    pages_blocks = [
+        page["blocks"] if page["page_number"] - 1 in write_pages else []
+        for page in ocr_data["pages"]
+    ]
+    await asyncio.get_running_loop().run_in_executor(
+        render_executor,
+        pdf_text_layer.write_text_layer,
+        input_pdf_path,
+        output_pdf_path,
+        pages_blocks,
+        garbage,
+    )
+    logger.info("Text layer embedded successfully")
 
-    try:
-        for page_idx, page in enumerate(ocr_result.pages):
-            if page_idx >= len(doc):
-                break
-
-            pdf_page = doc[page_idx]
-            page_rect = pdf_page.rect
-
-            # Scale factors to convert normalized coordinates to PDF coordinates
-            scale_x = page_rect.width
-            scale_y = page_rect.height
-
-            for block in page.blocks:
-                for line in block.lines:
-                    for word in line.words:
-                        # Get word text and bounding box
-                        text = word.value
-                        # docTR bbox is ((x0, y0), (x1, y1)) in normalized coordinates [0,1]
-                        bbox = word.geometry
-                        x0, y0 = bbox[0]
-                        y1 = bbox[1][1]
-
-                        # Convert normalized coordinates to PDF coordinates
-                        pdf_x0 = x0 * scale_x
-                        pdf_y0 = y0 * scale_y
-                        pdf_y1 = y1 * scale_y
-
-                        # Calculate font size based on box height
-                        box_height = pdf_y1 - pdf_y0
-                        font_size = max(1, box_height * 0.8)
-
-                        # Insert invisible text (render mode 3 = invisible)
-                        pdf_page.insert_text(
-                            point=fitz.Point(pdf_x0, pdf_y1 - box_height * 0.15),
-                            text=text,
-                            fontsize=font_size,
-                            fontname="helv",
-                            render_mode=3,  # Invisible text
-                        )
-
-        # Save the modified PDF
-        doc.save(output_pdf_path, garbage=4, deflate=True)
-        logger.info("Text layer embedded successfully")
 
-    finally:
-        doc.close()
+async def read_existing_text_layer(
+    pdf_path: str, page_numbers: list[int]
+) -> tuple[list[np.ndarray], list[dict[str, Any]]]:
+    """
+    Read pages' own text layer instead of running OCR on them.
+
+    Pages are still rendered, but only at thumbnail size for the history view.
+
+    Args:
+        pdf_path: Path to the PDF file
+        page_numbers: Indices (0-based) of the pages to read
+
+    Returns:
+        Tuple of (small HxWx3 page arrays, page dicts in the extract_ocr_data format)
+    """
+    loop = asyncio.get_running_loop()
+    images, pages = await asyncio.gather(
+        loop.run_in_executor(
+            render_executor,
+            pdf_renderer.render_pages,
+            pdf_path,
+            page_numbers,
+            DEFAULT_DPI / 72,
+            PREVIEW_SIDE,
+        ),
+        loop.run_in_executor(
+            render_executor, pdf_text_layer.read_text_layer, pdf_path, page_numbers
+        ),
+    )
+    return images, pages
+
+
+async def read_pdf_text(
+    pdf_path: str,
+    total: int,
+    text_pages: list[int],
+    dpi: int = DEFAULT_DPI,
+    preprocess: bool = False,
+    max_side: int | None = None,
+    heavy_denoise: bool = False,
+    binarize: bool = False,
+) -> tuple[list[np.ndarray], dict[str, Any], list[int]]:
+    """
+    Get the text of every page of a PDF.
+
+    Pages that already have a text layer are read from it, the others are OCR'd,
+    both at the same time. A mixed PDF (e.g. digitally born pages with scans
+    appended) therefore only pays for OCR on its scanned pages.
+
+    Args:
+        pdf_path: Path to the PDF file
+        total: Number of pages in the PDF
+        text_pages: Indices (0-based) of the pages with a text layer
+        dpi: Resolution for rendering pages for OCR
+        preprocess: Whether to apply OpenCV preprocessing
+        max_side: Optional cap on the longer side of pages rendered for OCR
+        heavy_denoise: Use Non-Local Means denoising when preprocessing
+        binarize: Apply adaptive thresholding when preprocessing
+
+    Returns:
+        Tuple of (HxWx3 page arrays, data in the extract_ocr_data format, both in
+        page order, and indices of the pages that were OCR'd)
+    """
+    has_text = set(text_pages)
+    ocr_pages = [page_idx for page_idx in range(total) if page_idx not in has_text]
+    logger.info(f"OCR needed for {len(ocr_pages)} of {total} pages")
+
+    async def ocr() -> tuple[list[np.ndarray], list[dict[str, Any]]]:
+        if not ocr_pages:
+            return [], []
+        images, ocr_result, _ = await ocr_pdf(
+            pdf_path,
+            ocr_pages,
+            dpi=dpi,
+            preprocess=preprocess,
+            max_side=max_side,
+            heavy_denoise=heavy_denoise,
+            binarize=binarize,
+        )
+        # A walk over every word, kept off the event loop
+        ocr_data = await asyncio.to_thread(extract_ocr_data, ocr_result)
+        return images, ocr_data["pages"]
+
+    async def read() -> tuple[list[np.ndarray], list[dict[str, Any]]]:
+        if not text_pages:
+            return [], []
+        return await read_existing_text_layer(pdf_path, text_pages)
+
+    (ocr_images, ocr_page_data), (text_images, text_page_data) = await asyncio.gather(
+        ocr(), read()
+    )
+    ordered = sorted(
+        zip(ocr_images + text_images, ocr_page_data + text_page_data),
+        key=lambda item: item[1]["page_number"],
+    )
+    images = [image for image, _ in ordered]
+    pages = [page for _, page in ordered]
+    full_text = join_page_texts([page["text"] for page in pages])
+    return images, {"pages": pages, "full_text": full_text}, ocr_pages
+
+
+async def record_cache_hit(job_id: str | None, key: str, ocr_data: dict[str, Any]) -> None:
+    """
+    Complete the history job of a request served from the result cache.
+
+    Page thumbnails are only recorded by the request that actually ran OCR.
+
+    Args:
+        job_id: History job ID, if history is available
+        key: Result cache key for the request
+        ocr_data: Cached OCR data with pages and full_text
+    """
+    logger.info(f"Serving cached result {key}")
+    if job_id:
+        try:
+            await history_service.complete_job(
+                job_id=job_id,
+                full_text=ocr_data["full_text"],
+                total_pages=len(ocr_data["pages"]),
+            )
+        except Exception as e:
+            logger.warning(f"History save failed: {e}")
 
 
 def extract_ocr_data(ocr_result: Any) -> dict[str, Any]:
@@ -480,124 +1068,85 @@ def extract_ocr_data(ocr_result: Any) -> dict[str, Any]:
     Returns:
         Dictionary with pages, blocks, and full text
     """
-    ocr_data: dict[str, Any] = {"pages": [], "full_text": ""}
-
-    for page_idx, page in enumerate(ocr_result.pages):
-        words: list[dict[str, Any]] = []
-
-        for block in page.blocks:
-            for line in block.lines:
-                for word in line.words:
-                    bbox = word.geometry
-                    x0, y0 = float(bbox[0][0]), float(bbox[0][1])
-                    x1, y1 = float(bbox[1][0]), float(bbox[1][1])
-                    words.append(
-                        {
-                            "text": word.value,
-                            "confidence": float(word.confidence),
-                            "x0": x0,
-                            "y0": y0,
-                            "x1": x1,
-                            "y1": y1,
-                            "cx": (x0 + x1) / 2.0,
-                            "cy": (y0 + y1) / 2.0,
-                        }
-                    )
+    ocr_data: dict[str, Any] = {"pages": []}
+    page_texts: list[str] = []
+
+    for page in ocr_result.pages:
+        # docTR already groups words into lines in reading order, so each line's
+        # text is its words joined as given; only paragraph breaks are inferred
+        lines = [line for block in page.blocks for line in block.lines if line.words]
+        words = [word for line in lines for word in line.words]
 
         # If no words, append empty page
         if not words:
             ocr_data["pages"].append(
                 {
-                    "page_number": page_idx + 1,
+                    "page_number": page.page_idx + 1,
                     "text": "",
                     "blocks": [],
                     "avg_confidence": 0.0,
                 }
             )
-            ocr_data["full_text"] += "\n\n"
+            page_texts.append("")
             continue
 
-        # Estimate a typical line height from word bboxes (normalized coordinates)
-        heights = [w["y1"] - w["y0"] for w in words if w["y1"] > w["y0"]]
-        line_h = statistics.median(heights) if heights else 0.03
-
-        # Sort words by vertical center then by x0
-        words.sort(key=lambda w: (w["cy"], w["x0"]))
-
-        # Cluster words into lines using vertical proximity
-        lines: list[list[dict[str, Any]]] = []
-        current_line: list[dict[str, Any]] = []
-        current_y: float = 0.0
-
-        for w in words:
-            if current_line == []:
-                current_line = [w]
-                current_y = w["cy"]
-                continue
-
-            # if the vertical distance is small, consider same line
-            if abs(w["cy"] - current_y) <= max(0.5 * line_h, 0.01):
-                current_line.append(w)
-                # update running line center
-                current_y = (current_y * (len(current_line) - 1) + w["cy"]) / len(current_line)
-            else:
-                lines.append(current_line)
-                current_line = [w]
-                current_y = w["cy"]
+        # All word boxes of the page as one (x0, y0, x1, y1) array, so the geometry
+        # below runs in NumPy instead of word by word
+        boxes = np.array([word.geometry for word in words], dtype=np.float64).reshape(-1, 4)
+        heights = boxes[:, 3] - boxes[:, 1]
+        heights = heights[heights > 0]
 
-        if current_line:
-            lines.append(current_line)
-
-        # Build text with paragraph breaks when vertical gap is large
+        # Estimate a typical line height from word bboxes (normalized coordinates)
+        line_h = float(np.median(heights)) if heights.size else 0.03
+        paragraph_gap = max(1.5 * line_h, 0.02)
+
+        # Mean vertical center of each line's words
+        line_sizes = np.array([len(line.words) for line in lines])
+        line_starts = np.concatenate(([0], np.cumsum(line_sizes[:-1])))
+        centers = (boxes[:, 1] + boxes[:, 3]) / 2.0
+        line_cys = np.add.reduceat(centers, line_starts) / line_sizes
+
+        # Insert a paragraph separator where the gap between the vertical centers
+        # of consecutive lines is significantly larger than the line height
+        breaks = set((np.flatnonzero(np.diff(line_cys) > paragraph_gap) + 1).tolist())
         page_lines_text: list[str] = []
-        page_blocks: list[dict[str, Any]] = []
-        page_conf_sum = 0.0
-        page_word_count = 0
-
-        for i, line in enumerate(lines):
-            # sort words in line by x0
-            line.sort(key=lambda w: w["x0"])
-            line_text = " ".join([w["text"] for w in line])
-            page_lines_text.append(line_text)
-
-            # collect word-level blocks
-            for w in line:
-                page_blocks.append(
-                    {
-                        "text": w["text"],
-                        "confidence": w["confidence"],
-                        "bbox": [[w["x0"], w["y0"]], [w["x1"], w["y1"]]],
-                    }
-                )
-                page_conf_sum += w["confidence"]
-                page_word_count += 1
-
-            # determine if a paragraph break is needed by comparing to next line's cy
-            if i < len(lines) - 1:
-                this_cy = statistics.mean([w["cy"] for w in line])
-                next_cy = statistics.mean([w["cy"] for w in lines[i + 1]])
-                gap = next_cy - this_cy
-                # if gap significantly larger than line height, insert paragraph separator
-                if gap > max(1.5 * line_h, 0.02):
-                    page_lines_text.append("")
+        for line_idx, line in enumerate(lines):
+            if line_idx in breaks:
+                page_lines_text.append("")
+            page_lines_text.append(" ".join([word.value for word in line.words]))
+
+        # Confidences are already Python floats; the coordinates come back as
+        # floats from .tolist() rather than NumPy scalars
+        page_blocks = [
+            {"text": word.value, "confidence": word.confidence, "bbox": [[x0, y0], [x1, y1]]}
+            for word, (x0, y0, x1, y1) in zip(words, boxes.tolist())
+        ]
 
         page_full_text = "\n".join(page_lines_text)
-        avg_confidence = page_conf_sum / page_word_count if page_word_count > 0 else 0.0
+        avg_confidence = sum([word.confidence for word in words]) / len(words)
 
         ocr_data["pages"].append(
             {
-                "page_number": page_idx + 1,
+                "page_number": page.page_idx + 1,
                 "text": page_full_text,
                 "blocks": page_blocks,
                 "avg_confidence": avg_confidence,
             }
         )
 
-        ocr_data["full_text"] += page_full_text + "\n\n"
+        page_texts.append(page_full_text)
+
+    ocr_data["full_text"] = join_page_texts(page_texts)
 
     return ocr_data
 
 
+def join_page_texts(page_texts: list[str]) -> str:
+    """Join page texts into a document's full text, each page followed by a blank line."""
+    # Join once instead of growing a string page by page (quadratic for long documents)
+    return "\n\n".join(page_texts) + "\n\n" if page_texts else ""
+
+
 # =============================================================================
 # OCR Endpoints
 # =============================================================================
@@ -608,7 +1157,12 @@ async def process_pdf(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(..., description="PDF file to process"),
     dpi: int = DEFAULT_DPI,
-    preprocess: bool = True,
+    preprocess: bool = Query(False, description=PREPROCESS_DESCRIPTION),
+    heavy_denoise: bool = False,
+    binarize: bool = False,
+    force_ocr: bool = False,
+    fast: bool = False,
+    optimize_output: bool = False,
 ) -> FileResponse:
     """
     Process a PDF file with OCR and return a searchable PDF.
@@ -619,11 +1173,26 @@ async def process_pdf(
     3. Run OCR to extract text (docTR)
     4. Embed invisible text layer (PyMuPDF)
 
+    Unless `force_ocr` is set, pages that already have a text layer are not
+    OCR'd and keep their own text; a PDF where every page has one is returned
+    unchanged.
+
     Args:
         background_tasks: FastAPI background tasks for cleanup
         file: Uploaded PDF file
         dpi: Resolution for PDF to image conversion (default: 300, range: 72-600)
-        preprocess: Whether to apply OpenCV preprocessing (default: True)
+        preprocess: Whether to apply OpenCV preprocessing; only useful for photos
+            of documents, not rendered PDF pages (default: False)
+        heavy_denoise: Preprocess with slow Non-Local Means denoising instead of a
+            bilateral filter, for very noisy scans (default: False)
+        binarize: Binarize pages with adaptive thresholding when preprocessing
+            (default: False)
+        force_ocr: OCR every page, even those that already have a text layer
+            (default: False)
+        fast: Favour latency over quality and size: skip preprocessing and save the
+            output without compacting it (default: False)
+        optimize_output: Deduplicate objects and compact the output PDF as far as
+            possible, at the cost of a slower save (default: False)
 
     Returns:
         PDF file with embedded searchable text layer
@@ -651,26 +1220,60 @@ async def process_pdf(
         file_size = await save_upload_file(file, input_pdf_path)
         logger.info(f"Saved PDF: {file_size / (1024*1024):.2f}MB")
 
-        # Convert PDF to images
-        images = pdf_to_images(str(input_pdf_path), dpi=dpi)
-
-        # Run OCR with docTR
-        ocr_result, dimensions = run_ocr_on_images(images, preprocess=preprocess)
+        # Serve an identical earlier request from the result cache
+        cache_key: str | None = None
+        if result_cache.is_enabled():
+            cache_key = await asyncio.to_thread(
+                result_cache.cache_key,
+                str(input_pdf_path),
+                "process-pdf",
+                ocr_config,
+                dpi,
+                preprocess,
+                heavy_denoise,
+                binarize,
+                force_ocr,
+                fast,
+                optimize_output,
+            )
+            # The cached PDF is linked into temp_dir, where eviction cannot remove it
+            # while the response is being sent
+            cached_pdf_path = temp_path / "output.pdf"
+            cached_data = await asyncio.to_thread(
+                result_cache.get_pdf, cache_key, cached_pdf_path
+            )
+            if cached_data is not None:
+                await record_cache_hit(job_id, cache_key, cached_data)
+                background_tasks.add_task(shutil.rmtree, temp_dir, ignore_errors=True)
+                return FileResponse(
+                    path=cached_pdf_path, media_type="application/pdf", filename=f"ocr_{filename}"
+                )
 
-        # Extract OCR data for history
-        ocr_data = extract_ocr_data(ocr_result)
+        # Pages that are already searchable keep their text; OCR would only
+        # duplicate it. The others are rendered and OCR'd with docTR.
+        total, text_pages = await asyncio.to_thread(
+            pdf_text_layer.inspect_pdf, str(input_pdf_path), not force_ocr
+        )
+        images, ocr_data, ocr_pages = await read_pdf_text(
+            str(input_pdf_path),
+            total,
+            text_pages,
+            dpi=dpi,
+            preprocess=preprocess and not fast,
+            heavy_denoise=heavy_denoise,
+            binarize=binarize,
+        )
 
         # Save to history (non-blocking)
         if job_id:
             try:
-                for i, (img, page_data) in enumerate(zip(images, ocr_data["pages"])):
-                    await history_service.add_page(
-                        job_id=job_id,
-                        page_number=i + 1,
-                        image=img,
-                        text=page_data["text"],
-                        confidence=page_data.get("avg_confidence", 0.0),
-                    )
+                await history_service.add_pages_bulk(
+                    job_id=job_id,
+                    items=[
+                        (i + 1, img, page_data["text"], page_data.get("avg_confidence", 0.0))
+                        for i, (img, page_data) in enumerate(zip(images, ocr_data["pages"]))
+                    ],
+                )
                 await history_service.complete_job(
                     job_id=job_id,
                     full_text=ocr_data["full_text"],
@@ -679,22 +1282,27 @@ async def process_pdf(
             except Exception as e:
                 logger.warning(f"History save failed: {e}")
 
-        # Embed text layer into PDF
-        output_pdf_path = temp_path / "output.pdf"
-        embed_text_layer(str(input_pdf_path), str(output_pdf_path), ocr_result, dimensions)
-
-        # Copy to persistent temp file
-        with tempfile.NamedTemporaryFile(mode="wb", suffix=".pdf", delete=False) as tmp_file:
-            final_output_path = tmp_file.name
-            with open(output_pdf_path, "rb") as src:
-                shutil.copyfileobj(src, tmp_file)
+        # Embed text layer into PDF; a fully searchable upload is returned unchanged
+        output_pdf_path = input_pdf_path
+        if ocr_pages:
+            output_pdf_path = temp_path / "output.pdf"
+            await embed_text_layer(
+                str(input_pdf_path),
+                str(output_pdf_path),
+                ocr_data,
+                ocr_pages,
+                garbage=4 if optimize_output else 0 if fast else 1,
+            )
 
-        # Schedule cleanup
-        background_tasks.add_task(cleanup_file, final_output_path)
-        background_tasks.add_task(shutil.rmtree, temp_dir)
+        # Serve the output straight from the working directory; background tasks run
+        # after the response has been sent, so it is cached and then removed with the
+        # rest of temp_dir
+        if cache_key:
+            background_tasks.add_task(result_cache.put, cache_key, ocr_data, output_pdf_path)
+        background_tasks.add_task(shutil.rmtree, temp_dir, ignore_errors=True)
 
         return FileResponse(
-            path=final_output_path,
+            path=output_pdf_path,
             media_type="application/pdf",
             filename=f"ocr_{filename}",
         )
@@ -724,17 +1332,32 @@ async def process_pdf(
 
 @app.post("/extract-text")
 async def extract_text(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(..., description="PDF file to process"),
     dpi: int = DEFAULT_DPI,
-    preprocess: bool = True,
+    preprocess: bool = Query(False, description=PREPROCESS_DESCRIPTION),
+    heavy_denoise: bool = False,
+    binarize: bool = False,
+    max_side: int = Query(EXTRACT_MAX_SIDE, ge=0),
+    force_ocr: bool = False,
 ) -> dict[str, Any]:
     """
     Extract text from PDF using OCR without modifying the PDF.
 
     Args:
+        background_tasks: FastAPI background tasks for caching the result
         file: Uploaded PDF file
         dpi: Resolution for PDF to image conversion (default: 300, range: 72-600)
-        preprocess: Whether to apply OpenCV preprocessing (default: True)
+        preprocess: Whether to apply OpenCV preprocessing; only useful for photos
+            of documents, not rendered PDF pages (default: False)
+        heavy_denoise: Preprocess with slow Non-Local Means denoising instead of a
+            bilateral filter, for very noisy scans (default: False)
+        binarize: Binarize pages with adaptive thresholding when preprocessing
+            (default: False)
+        max_side: Cap on the longer side of rendered pages in pixels; pages are
+            rendered below `dpi` if needed (default: 2048, 0 disables the cap)
+        force_ocr: OCR every page, even those that already have a text layer,
+            whose text is otherwise returned directly (default: False)
 
     Returns:
         JSON with extracted text and bounding boxes
@@ -762,26 +1385,56 @@ async def extract_text(
         file_size = await save_upload_file(file, input_pdf_path)
         logger.info(f"Saved PDF: {file_size / (1024*1024):.2f}MB")
 
-        # Convert PDF to images
-        images = pdf_to_images(str(input_pdf_path), dpi=dpi)
-
-        # Run OCR
-        ocr_result, _ = run_ocr_on_images(images, preprocess=preprocess)
+        # Serve an identical earlier request from the result cache
+        cache_key: str | None = None
+        if result_cache.is_enabled():
+            cache_key = await asyncio.to_thread(
+                result_cache.cache_key,
+                str(input_pdf_path),
+                "extract-text",
+                ocr_config,
+                dpi,
+                preprocess,
+                heavy_denoise,
+                binarize,
+                max_side,
+                force_ocr,
+            )
+            cached_data = await asyncio.to_thread(result_cache.get, cache_key)
+            if cached_data is not None:
+                await record_cache_hit(job_id, cache_key, cached_data)
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                return {
+                    "filename": filename,
+                    "pages": cached_data["pages"],
+                    "full_text": cached_data["full_text"],
+                }
 
-        # Extract data from OCR result
-        ocr_data = extract_ocr_data(ocr_result)
+        # Pages with a text layer are read directly, only the others are OCR'd
+        total, text_pages = await asyncio.to_thread(
+            pdf_text_layer.inspect_pdf, str(input_pdf_path), not force_ocr
+        )
+        images, ocr_data, _ = await read_pdf_text(
+            str(input_pdf_path),
+            total,
+            text_pages,
+            dpi=dpi,
+            preprocess=preprocess,
+            max_side=max_side,
+            heavy_denoise=heavy_denoise,
+            binarize=binarize,
+        )
 
         # Save to history (non-blocking)
         if job_id:
             try:
-                for i, (img, page_data) in enumerate(zip(images, ocr_data["pages"])):
-                    await history_service.add_page(
-                        job_id=job_id,
-                        page_number=i + 1,
-                        image=img,
-                        text=page_data["text"],
-                        confidence=page_data.get("avg_confidence", 0.0),
-                    )
+                await history_service.add_pages_bulk(
+                    job_id=job_id,
+                    items=[
+                        (i + 1, img, page_data["text"], page_data.get("avg_confidence", 0.0))
+                        for i, (img, page_data) in enumerate(zip(images, ocr_data["pages"]))
+                    ],
+                )
                 await history_service.complete_job(
                     job_id=job_id,
                     full_text=ocr_data["full_text"],
@@ -791,6 +1444,8 @@ async def extract_text(
                 logger.warning(f"History save failed: {e}")
 
         shutil.rmtree(temp_dir, ignore_errors=True)
+        if cache_key:
+            background_tasks.add_task(result_cache.put, cache_key, ocr_data)
 
         return {
             "filename": filename,
@@ -819,9 +1474,3 @@ async def extract_text(
         raise HTTPException(
             status_code=500, detail="An error occurred while extracting text from the PDF"
         )
-
-
-if __name__ == "__main__":
-    import uvicorn
-
-    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,89 @@
+"""
+Fixed batch shapes for backbones compiled for static input shapes.
+
+docTR runs pages through detection and word crops through recognition in batches
+of a configured size, but the last batch of a call is usually short, and the
+number of crops per recognition batch changes with every page. A backbone
+compiled for fixed shapes (TensorRT engines are built per input shape) would
+then build a new engine for each new batch size, in the middle of a request, and
+torch.compile falls back to eager once its recompile limit is hit. This module
+wraps such a backbone so short batches are zero-padded to one of a few fixed
+sizes and the outputs are sliced back, so it only ever sees the shapes it was
+warmed up with.
+
+Padding everything to the full batch size would make a page with a dozen words
+pay for a full recognition batch, so batches are padded to the smallest of a
+series of halving sizes that fits instead: at most twice the work of the batch
+itself, for one engine per size.
+"""
+from collections.abc import Callable, Sequence
+from typing import Any
+
+import torch
+from torch import nn
+
+
+class PaddedBatch(nn.Module):
+    """
+    Wrapper that runs a module on batches padded to a few fixed sizes.
+
+    Batches larger than the largest size are passed through unchanged.
+
+    Args:
+        module: Backbone taking an NxCxHxW batch, e.g. as returned by torch.compile;
+            its output may be a tensor or a dict, list or tuple of tensors with the
+            batch as first dimension
+        batch_sizes: Batch sizes the module is called with
+    """
+
+    def __init__(
+        self, module: Callable[[torch.Tensor], Any], batch_sizes: Sequence[int]
+    ) -> None:
+        super().__init__()
+        self.module = module
+        self.batch_sizes = sorted(batch_sizes)
+
+    def forward(self, x: torch.Tensor) -> Any:
+        """
+        Run the module on `x` padded with zeros to the smallest batch size that fits.
+
+        Args:
+            x: Input batch
+
+        Returns:
+            The module's output for the rows of `x` only
+        """
+        size = len(x)
+        padded_size = next((n for n in self.batch_sizes if n >= size), size)
+        if padded_size == size:
+            return self.module(x)
+        padding = x.new_zeros((padded_size - size, *x.shape[1:]))
+        return _take(self.module(torch.cat([x, padding])), size)
+
+
+def halving_batch_sizes(batch_size: int, smallest: int) -> list[int]:
+    """
+    List `batch_size` and its successive halves down to `smallest`.
+
+    Args:
+        batch_size: Largest batch size
+        smallest: Size below which batches are not halved further
+
+    Returns:
+        Batch sizes in increasing order
+    """
+    sizes = [batch_size]
+    while sizes[0] // 2 >= smallest:
+        sizes.insert(0, sizes[0] // 2)
+    return sizes
+
+
+def _take(output: Any, size: int) -> Any:
+    """Slice the first `size` rows off every tensor in a module output."""
+    if isinstance(output, torch.Tensor):
+        return output[:size]
+    if isinstance(output, dict):
+        return {key: _take(value, size) for key, value in output.items()}
+    if isinstance(output, (list, tuple)):
+        return type(output)(_take(value, size) for value in output)
+    return output
@@ -0,0 +1,60 @@
+"""
+PDF page rasterization with PyMuPDF.
+
+Kept separate from main.py so render worker processes (started with the
+"spawn" method) only import PyMuPDF, not docTR/torch and the FastAPI app.
+PyMuPDF holds the GIL while rendering, so parallelism has to come from
+processes rather than threads.
+"""
+import fitz
+import numpy as np
+
+
+def init_worker() -> None:
+    """
+    Initialize a render worker process (ProcessPoolExecutor initializer).
+
+    Imports the text layer writer up front as well, so neither kind of task pays
+    for module imports on the first request a worker picks up.
+    """
+    import pdf_text_layer  # noqa: F401
+
+
+def render_pages(
+    pdf_path: str, page_numbers: list[int], zoom: float, max_side: int | None = None
+) -> list[np.ndarray]:
+    """
+    Render PDF pages to RGB arrays.
+
+    The arrays wrap the pixmap sample bytes without an extra copy or a PIL image,
+    in the HxWx3 uint8 layout docTR and OpenCV consume.
+
+    Args:
+        pdf_path: Path to the PDF file
+        page_numbers: Indices (0-based) of the pages to render, in output order
+        zoom: Scale factor relative to 72 DPI
+        max_side: Optional cap on the longer side of each rendered page, in pixels;
+            pages that would come out larger are rendered at a lower zoom instead
+
+    Returns:
+        List of HxWx3 uint8 arrays, one per page
+    """
+    pages: list[np.ndarray] = []
+    # Create transformation matrix for desired DPI
+    mat = fitz.Matrix(zoom, zoom)
+
+    with fitz.open(pdf_path) as doc:
+        for page_num in page_numbers:
+            page = doc[page_num]
+            page_mat = mat
+            if max_side:
+                # Rendering at the capped size is far cheaper than rendering large and
+                # downsampling afterwards
+                page_zoom = min(zoom, max_side / max(page.rect.width, page.rect.height))
+                page_mat = fitz.Matrix(page_zoom, page_zoom)
+            pix = page.get_pixmap(matrix=page_mat, colorspace=fitz.csRGB, alpha=False)
+            samples = np.frombuffer(pix.samples, dtype=np.uint8)
+            pages.append(samples.reshape(pix.height, pix.width, 3))
+
+    return pages
+
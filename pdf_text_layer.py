@@ -0,0 +1,152 @@
+"""
+Text layer reading and writing with PyMuPDF.
+
+Like pdf_renderer, this module only imports PyMuPDF and NumPy so it can run in
+the "spawn" render worker processes. It takes and returns the plain page and
+word dicts of the OCR results rather than docTR results, which keeps what
+crosses a worker boundary small and picklable.
+"""
+from typing import Any
+
+import fitz
+import numpy as np
+
+# Word as {"text", "confidence", "bbox": [[x0, y0], [x1, y1]]} with coordinates
+# normalized to [0, 1], the block format of the OCR results
+WordBlock = dict[str, Any]
+
+# Font of the invisible text, loaded once per process (render workers import this
+# module at startup)
+_HELV_FONT = fitz.Font("helv")
+
+
+def write_text_layer(
+    input_pdf_path: str,
+    output_pdf_path: str,
+    pages_blocks: list[list[WordBlock]],
+    garbage: int = 1,
+) -> None:
+    """
+    Write invisible, searchable text at each word's position and save the PDF.
+
+    Args:
+        input_pdf_path: Path to input PDF
+        output_pdf_path: Path to output PDF with text layer
+        pages_blocks: Words of each page, in page order
+        garbage: PyMuPDF garbage collection level for the save: 0 keeps every
+            object, 1 drops unreferenced ones, up to 4 which also deduplicates
+            objects and streams (smallest file, but rescans the whole document)
+    """
+    with fitz.open(input_pdf_path) as doc:
+        for page_idx, blocks in enumerate(pages_blocks):
+            if page_idx >= len(doc):
+                break
+            if not blocks:
+                continue
+
+            pdf_page = doc[page_idx]
+            page_rect = pdf_page.rect
+
+            # Convert normalized coordinates to PDF coordinates for all words at once
+            boxes = np.array(
+                [(x0, y0, y1) for (x0, y0), (_, y1) in (block["bbox"] for block in blocks)],
+                dtype=np.float64,
+            )
+            boxes *= (page_rect.width, page_rect.height, page_rect.height)
+            x0, y0, y1 = boxes.T
+
+            # Font size from box height, baseline slightly above the box bottom
+            box_height = y1 - y0
+            font_sizes = np.maximum(1, box_height * 0.8)
+            baselines = y1 - box_height * 0.15
+
+            # One TextWriter per page shares the font and appends a single text
+            # object, instead of a content stream edit per insert_text() call
+            writer = fitz.TextWriter(page_rect)
+            for block, x, y, font_size in zip(
+                blocks, x0.tolist(), baselines.tolist(), font_sizes.tolist()
+            ):
+                writer.append((x, y), block["text"], font=_HELV_FONT, fontsize=font_size)
+            writer.write_text(pdf_page, render_mode=3)  # render mode 3 = invisible
+
+        # Save the modified PDF
+        doc.save(output_pdf_path, garbage=garbage, deflate=True)
+
+
+def inspect_pdf(pdf_path: str, check_text: bool = True) -> tuple[int, list[int]]:
+    """
+    Get a PDF's page count and which pages have a text layer, opening it only once.
+
+    Args:
+        pdf_path: Path to the PDF file
+        check_text: Whether to look for a text layer at all
+
+    Returns:
+        Tuple of (number of pages, indices of the pages with a text layer; empty
+        unless check_text)
+    """
+    with fitz.open(pdf_path) as doc:
+        return len(doc), text_layer_pages(doc) if check_text else []
+
+
+def text_layer_pages(doc: fitz.Document, min_chars_per_page: int = 100) -> list[int]:
+    """
+    Find the pages that already carry extractable text, e.g. are digitally born.
+
+    Every page is checked on its own, so the scanned pages of a mixed PDF are
+    still found.
+
+    Args:
+        doc: Open PDF document
+        min_chars_per_page: Characters of text a page needs to count as having a
+            text layer
+
+    Returns:
+        Indices (0-based) of the pages with at least `min_chars_per_page` characters
+    """
+    return [
+        page_idx
+        for page_idx, page in enumerate(doc)
+        if len(page.get_text("text").strip()) >= min_chars_per_page
+    ]
+
+
+def read_text_layer(pdf_path: str, page_numbers: list[int]) -> list[dict[str, Any]]:
+    """
+    Read the existing text layer of some pages.
+
+    Pages are returned in the same shape as OCR results, with word boxes normalized
+    to [0, 1] and a confidence of 1.0 since the text is exact.
+
+    Args:
+        pdf_path: Path to the PDF file
+        page_numbers: Indices (0-based) of the pages to read
+
+    Returns:
+        List of page dicts with page_number, text, blocks and avg_confidence, in
+        the order of page_numbers
+    """
+    pages: list[dict[str, Any]] = []
+    with fitz.open(pdf_path) as doc:
+        for page_idx in page_numbers:
+            page = doc[page_idx]
+            width = page.rect.width
+            height = page.rect.height
+            # Words come as (x0, y0, x1, y1, text, block_no, line_no, word_no)
+            blocks = [
+                {
+                    "text": text,
+                    "confidence": 1.0,
+                    "bbox": [[x0 / width, y0 / height], [x1 / width, y1 / height]],
+                }
+                for x0, y0, x1, y1, text, *_ in page.get_text("words")
+            ]
+            pages.append(
+                {
+                    "page_number": page_idx + 1,
+                    "text": page.get_text("text").strip(),
+                    "blocks": blocks,
+                    "avg_confidence": 1.0 if blocks else 0.0,
+                }
+            )
+    return pages
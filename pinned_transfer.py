@@ -0,0 +1,85 @@
+"""
+Pinned-memory host-to-GPU transfer for docTR input batches.
+
+docTR normalizes each batch on the CPU and then moves it to the model's device
+with a plain `.to()`, which copies from pageable memory: CUDA has to stage the
+data through its own pinned buffer and the copy blocks the calling thread. This
+module wraps a predictor's pre-processor so batches are written into a small ring
+of preallocated page-locked buffers and copied to the GPU asynchronously on a
+dedicated stream. The tensors handed back to docTR are already on the device in
+the model's dtype, so docTR's own device move is a no-op.
+"""
+import threading
+from typing import cast
+
+import numpy as np
+import torch
+from doctr.models.preprocessor import PreProcessor
+from torch import nn
+
+
+class PinnedPreProcessor(nn.Module):
+    """
+    docTR pre-processor wrapper that transfers batches through pinned host buffers.
+
+    Args:
+        pre_processor: The predictor's docTR PreProcessor
+        dtype: The model's dtype; batches are cast while being staged, so FP16/BF16
+            models also halve the bytes sent over PCIe
+        slots: Number of staging buffers in the ring
+    """
+
+    pre_processor: PreProcessor
+
+    def __init__(self, pre_processor: PreProcessor, dtype: torch.dtype, slots: int = 2) -> None:
+        super().__init__()
+        self.pre_processor = pre_processor
+        self.device = torch.device("cuda", torch.cuda.current_device())
+        # PreProcessor always gives Resize its (H, W) output size, never a single int
+        height, width = cast(tuple[int, int], pre_processor.resize.size)
+        shape = (pre_processor.batch_size, 3, height, width)
+        # Allocated once: page-locking memory is expensive, reusing it is not
+        self._slots = [torch.empty(shape, dtype=dtype, pin_memory=True) for _ in range(slots)]
+        self._slot_done = [torch.cuda.Event() for _ in range(slots)]
+        self._next_slot = 0
+        self._stream = torch.cuda.Stream(self.device)
+        self._lock = threading.Lock()
+
+    def forward(
+        self, x: torch.Tensor | np.ndarray | list[torch.Tensor | np.ndarray]
+    ) -> list[torch.Tensor]:
+        """
+        Pre-process inputs with docTR and start moving the batches to the GPU.
+
+        Args:
+            x: Inputs accepted by the wrapped pre-processor
+
+        Returns:
+            List of batches on the GPU, in order
+        """
+        batches = self.pre_processor(x)
+        consumer = torch.cuda.current_stream(self.device)
+        gpu_batches: list[torch.Tensor] = []
+
+        # The lock keeps concurrent OCR calls from handing out the same slot
+        with self._lock, torch.cuda.stream(self._stream):
+            for batch in batches:
+                slot = self._slots[self._next_slot]
+                done = self._slot_done[self._next_slot]
+                if batch.shape[1:] == slot.shape[1:] and len(batch) <= len(slot):
+                    self._next_slot = (self._next_slot + 1) % len(self._slots)
+                    # Wait until the slot's previous transfer has finished reading it
+                    done.synchronize()
+                    staged = slot[: len(batch)]
+                    staged.copy_(batch)
+                    gpu_batch = staged.to(self.device, non_blocking=True)
+                    done.record(self._stream)
+                else:
+                    # Not the fixed shape the buffers were sized for
+                    gpu_batch = batch.to(self.device, dtype=slot.dtype)
+                # The batch is allocated on the copy stream but consumed on the caller's
+                gpu_batch.record_stream(consumer)
+                gpu_batches.append(gpu_batch)
+
+        consumer.wait_stream(self._stream)
+        return gpu_batches
@@ -0,0 +1,186 @@
+"""
+Content-addressed disk cache for OCR results.
+
+Entries are keyed by a BLAKE2b hash of the uploaded PDF together with the
+request options and model configuration that affect the result, so re-uploading
+the same document skips rendering and OCR entirely. Each entry is a <key>.json file with the
+extracted pages and full text, plus a <key>.pdf file for /process-pdf outputs.
+
+File modification times double as the LRU order: hits touch their files, and
+the least recently used entries are evicted, as a whole, once the cache
+directory grows past CACHE_MAX_BYTES. All functions do blocking file I/O and
+are meant to be called through asyncio.to_thread().
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from collections.abc import Callable
+from pathlib import Path
+from typing import IO, Any
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("RESULT_CACHE_DIR", "data/cache"))
+# Total size the cache may grow to; 0 disables caching
+CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", "512")) * 1024 * 1024
+# Part of every key; bump it when the stored result format changes
+CACHE_FORMAT_VERSION = 1
+
+
+def is_enabled() -> bool:
+    """Check whether result caching is enabled."""
+    return CACHE_MAX_BYTES > 0
+
+
+def cache_key(pdf_path: str, *options: object) -> str:
+    """
+    Compute the cache key for a PDF and the options it is processed with.
+
+    Args:
+        pdf_path: Path to the uploaded PDF
+        options: Endpoint name, model configuration and every parameter that changes
+            the result
+
+    Returns:
+        Hex digest identifying the result
+    """
+    with open(pdf_path, "rb") as f:
+        digest = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=20))
+    digest.update(repr((CACHE_FORMAT_VERSION, *options)).encode())
+    return digest.hexdigest()
+
+
+def get(key: str) -> dict[str, Any] | None:
+    """
+    Look up a cached result and mark it as recently used.
+
+    Args:
+        key: Cache key from cache_key()
+
+    Returns:
+        OCR data with pages and full_text, or None on a miss
+    """
+    data_path = CACHE_DIR / f"{key}.json"
+    try:
+        data = orjson.loads(data_path.read_bytes())
+        os.utime(data_path)
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
+    return data
+
+
+def get_pdf(key: str, destination: Path) -> dict[str, Any] | None:
+    """
+    Look up a cached result and place its output PDF at `destination`.
+
+    The PDF is hard-linked, or copied when the cache is on another filesystem,
+    so it can be served from `destination` even if the entry is evicted
+    meanwhile. An entry without the PDF, e.g. one stored by /extract-text, is a
+    miss.
+
+    Args:
+        key: Cache key from cache_key()
+        destination: Path to place the output PDF at; must not exist yet
+
+    Returns:
+        OCR data with pages and full_text, or None on a miss
+    """
+    pdf_path = CACHE_DIR / f"{key}.pdf"
+    try:
+        # os.utime() rather than touch(), which would create a missing file
+        os.utime(pdf_path)
+        _link_or_copy(pdf_path, destination)
+    except OSError:
+        destination.unlink(missing_ok=True)
+        return None
+    data = get(key)
+    if data is None:
+        destination.unlink(missing_ok=True)
+    return data
+
+
+def put(key: str, data: dict[str, Any], pdf_path: Path | None = None) -> None:
+    """
+    Store a result, then evict least recently used entries over the size limit.
+
+    Files are written under temporary names and renamed into place, so readers
+    never see a partial entry. The PDF is stored before the JSON, so an entry's
+    data only shows up once the entry is complete.
+
+    Args:
+        key: Cache key from cache_key()
+        data: OCR data with pages and full_text
+        pdf_path: Output PDF to store alongside the data, if any
+    """
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        if pdf_path is not None:
+            _write_atomic(CACHE_DIR / f"{key}.pdf", lambda f: _copy_file(pdf_path, f))
+        _write_atomic(CACHE_DIR / f"{key}.json", lambda f: f.write(orjson.dumps(data)))
+        _evict()
+    except (OSError, orjson.JSONEncodeError) as e:
+        logger.warning(f"Failed to cache result {key}: {e}")
+
+
+def _copy_file(source: Path, destination: IO[bytes]) -> None:
+    """Copy a file's contents into an open file."""
+    with open(source, "rb") as f:
+        shutil.copyfileobj(f, destination)
+
+
+def _link_or_copy(source: Path, destination: Path) -> None:
+    """Hard-link a file to a new path, copying it across filesystems."""
+    try:
+        os.link(source, destination)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # Unlinking the source during the copy is harmless: the open file stays readable
+        shutil.copyfile(source, destination)
+
+
+def _write_atomic(path: Path, write: Callable[[IO[bytes]], object]) -> None:
+    """Write a cache file through `write` under a temporary name, then rename it."""
+    fd, temp_name = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(temp_name, path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+
+
+def _evict() -> None:
+    """
+    Delete least recently used entries until the cache fits CACHE_MAX_BYTES.
+
+    An entry's files are removed together, JSON first, so get() never finds the
+    data of an entry whose PDF is gone.
+    """
+    entries: dict[str, tuple[float, int, list[Path]]] = {}
+    for entry in os.scandir(CACHE_DIR):
+        if entry.name.endswith(".tmp"):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        key, suffix = os.path.splitext(entry.name)
+        mtime, size, paths = entries.get(key, (0.0, 0, []))
+        path = Path(entry.path)
+        # The JSON goes first in deletion order
+        paths = [path, *paths] if suffix == ".json" else [*paths, path]
+        entries[key] = (max(mtime, stat.st_mtime), size + stat.st_size, paths)
+
+    total = sum(size for _, size, _ in entries.values())
+    for _, size, paths in sorted(entries.values()):
+        if total <= CACHE_MAX_BYTES:
+            break
+        for path in paths:
+            path.unlink(missing_ok=True)
+        total -= size
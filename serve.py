@@ -0,0 +1,13 @@
+"""
+Start the OCR service with uvicorn: `python serve.py`.
+
+The app is handed to uvicorn as the import string "main:app" rather than main.py
+being run as a script. Render workers are started with "spawn", which re-imports
+the launching script in every worker; launched from here, that is this small
+module, so the workers never import torch, docTR or the app.
+"""
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("main:app", host="0.0.0.0", port=8000)
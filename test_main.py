@@ -1,9 +1,31 @@
 """
 Basic tests for OCR Service.
 """
+import asyncio
+import importlib.util
+import os
+import shutil
+import sqlite3
+import tempfile
+from typing import Any
+
+import fitz
+import numpy as np
+import torch
+from doctr.io.elements import Block, Document, Line, Page, Word
+from doctr.models.preprocessor import PreProcessor
 from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+import database
+import history_service
+import main
+import result_cache
+from fused_preprocessor import FusedPreProcessor
 from main import app
+from padded_batch import PaddedBatch, halving_batch_sizes
+from pdf_text_layer import write_text_layer
 
 client = TestClient(app)
 
@@ -69,3 +91,582 @@ def test_extract_text_invalid_dpi() -> None:
     response = client.post("/extract-text", files=files, params={"dpi": 1000})
     assert response.status_code == 400
     assert "DPI must be between" in response.json()["detail"]
+
+
+def test_extract_text_file_too_large(monkeypatch) -> None:
+    """Test extract-text rejects uploads larger than MAX_FILE_SIZE."""
+    monkeypatch.setattr(main, "MAX_FILE_SIZE", 1024)
+    files = {"file": ("test.pdf", b"%PDF-1.4 " + b"0" * 4096, "application/pdf")}
+    response = client.post("/extract-text", files=files)
+    assert response.status_code == 413
+    assert "File too large" in response.json()["detail"]
+
+
+def test_process_pdf_rejected_by_content_length(monkeypatch) -> None:
+    """Test oversized uploads are rejected from Content-Length before parsing."""
+    monkeypatch.setattr(main, "MAX_FILE_SIZE", 1024)
+    files = {"file": ("test.pdf", b"%PDF-1.4 " + b"0" * (128 * 1024), "application/pdf")}
+    response = client.post("/process-pdf", files=files)
+    assert response.status_code == 413
+    assert "File too large" in response.json()["detail"]
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+
+
+def test_extract_text_uses_existing_text_layer(monkeypatch, tmp_path) -> None:
+    """Test extract-text returns a digitally born PDF's own text without OCR."""
+    monkeypatch.setattr(result_cache, "CACHE_DIR", tmp_path)
+    with fitz.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), "Digitally born text. " * 8, fontsize=8)
+        pdf_bytes = doc.tobytes()
+
+    files = {"file": ("test.pdf", pdf_bytes, "application/pdf")}
+    response = client.post("/extract-text", files=files)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["pages"]) == 1
+    assert data["pages"][0]["blocks"][0]["text"] == "Digitally"
+    assert "Digitally born text." in data["full_text"]
+
+    # The same upload is answered from the result cache the second time
+    assert len(list(tmp_path.glob("*.json"))) == 1
+    monkeypatch.setattr(main, "read_existing_text_layer", None)
+    cached = client.post("/extract-text", files=files)
+    assert cached.status_code == 200
+    assert cached.json() == data
+
+
+def test_result_cache_round_trip(monkeypatch, tmp_path) -> None:
+    """Test a stored result is found again under the same PDF and options only."""
+    monkeypatch.setattr(result_cache, "CACHE_DIR", tmp_path / "cache")
+    pdf_path = tmp_path / "output.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4 output")
+    data = {"pages": [], "full_text": "text"}
+
+    key = result_cache.cache_key(str(pdf_path), "process-pdf", 300)
+    assert key != result_cache.cache_key(str(pdf_path), "process-pdf", 200)
+    monkeypatch.setattr(result_cache, "CACHE_FORMAT_VERSION", result_cache.CACHE_FORMAT_VERSION + 1)
+    assert key != result_cache.cache_key(str(pdf_path), "process-pdf", 300)
+    assert result_cache.get(key) is None
+
+    result_cache.put(key, data, pdf_path)
+    assert result_cache.get(key) == data
+    served_pdf = tmp_path / "served.pdf"
+    assert result_cache.get_pdf(key, served_pdf) == data
+    assert served_pdf.read_bytes() == b"%PDF-1.4 output"
+
+    # The served copy outlives the entry's eviction
+    for path in (tmp_path / "cache").iterdir():
+        path.unlink()
+    assert served_pdf.read_bytes() == b"%PDF-1.4 output"
+
+
+def test_result_cache_evicts_least_recently_used_entries(monkeypatch, tmp_path) -> None:
+    """Test eviction removes whole entries, least recently used first."""
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(result_cache, "CACHE_DIR", cache_dir)
+    pdf_path = tmp_path / "output.pdf"
+    pdf_path.write_bytes(b"0" * 1000)
+    data = {"pages": [], "full_text": ""}
+
+    for key in ("k1", "k2"):
+        result_cache.put(key, data, pdf_path)
+    # k1 was stored first, but a hit makes k2 the least recently used entry. As in
+    # put(), each entry's PDF is older than its JSON.
+    for age, key in ((1, "k1"), (3, "k2")):
+        os.utime(cache_dir / f"{key}.pdf", (age, age))
+        os.utime(cache_dir / f"{key}.json", (age + 1, age + 1))
+    assert result_cache.get_pdf("k1", tmp_path / "served.pdf") is not None
+
+    # Room for two entries of a little over 1000 bytes each
+    monkeypatch.setattr(result_cache, "CACHE_MAX_BYTES", 2500)
+    result_cache.put("k3", data, pdf_path)
+    assert sorted(path.name for path in cache_dir.iterdir()) == [
+        "k1.json",
+        "k1.pdf",
+        "k3.json",
+        "k3.pdf",
+    ]
+
+
+def test_result_cache_entry_missing_its_pdf_is_a_miss(monkeypatch, tmp_path) -> None:
+    """Test a lookup needing a PDF misses, without creating one, if it is gone."""
+    monkeypatch.setattr(result_cache, "CACHE_DIR", tmp_path)
+    (tmp_path / "k1.json").write_bytes(b'{"pages": [], "full_text": ""}')
+
+    served_pdf = tmp_path / "served.pdf"
+    assert result_cache.get_pdf("k1", served_pdf) is None
+    assert not (tmp_path / "k1.pdf").exists()
+    assert not served_pdf.exists()
+    assert result_cache.get("k1") == {"pages": [], "full_text": ""}
+
+
+def test_mixed_pdf_only_ocrs_pages_without_text(monkeypatch, tmp_path) -> None:
+    """Test pages with a text layer keep it and only the scanned pages are OCR'd."""
+    monkeypatch.setattr(result_cache, "CACHE_MAX_BYTES", 0)
+    ocr_batches: list[int] = []
+
+    def fake_ocr_model(pages: list) -> Document:
+        ocr_batches.append(len(pages))
+        word = Word("Scanned", 0.9, ((0.1, 0.1), (0.3, 0.15)))
+        return Document(
+            [
+                Page(
+                    np.zeros((4, 4, 3), dtype=np.uint8),
+                    [Block(lines=[Line([word])])],
+                    page_idx,
+                    page.shape[:2],
+                )
+                for page_idx, page in enumerate(pages)
+            ]
+        )
+
+    monkeypatch.setattr(main, "ocr_model", fake_ocr_model)
+    with fitz.open() as doc:
+        for page_idx in range(3):
+            page = doc.new_page()
+            if page_idx != 1:
+                page.insert_text((72, 72), "Digitally born text. " * 8, fontsize=8)
+        pdf_bytes = doc.tobytes()
+    files = {"file": ("mixed.pdf", pdf_bytes, "application/pdf")}
+
+    response = client.post("/process-pdf", files=files, params={"dpi": 72})
+    assert response.status_code == 200
+    assert ocr_batches == [1]
+    with fitz.open(stream=response.content, filetype="pdf") as output:
+        texts = [page.get_text("text") for page in output]
+    assert "Scanned" in texts[1]
+    assert "Digitally born" in texts[0] and "Scanned" not in texts[0]
+    assert "Digitally born" in texts[2] and "Scanned" not in texts[2]
+
+    response = client.post("/extract-text", files=files, params={"dpi": 72})
+    assert response.status_code == 200
+    pages = response.json()["pages"]
+    assert [page["page_number"] for page in pages] == [1, 2, 3]
+    assert pages[1]["text"] == "Scanned"
+    assert pages[0]["avg_confidence"] == 1.0
+    assert "Digitally born" in pages[2]["text"]
+
+
+def test_ocr_pdf_fills_every_chunk_but_the_last(monkeypatch, tmp_path) -> None:
+    """Test pages are OCR'd in full chunks and only kept at preview size."""
+    monkeypatch.setattr(main, "OCR_CHUNK_PAGES", 4)
+    ocr_batches: list[int] = []
+
+    def fake_ocr_model(pages: list) -> Document:
+        ocr_batches.append(len(pages))
+        return Document(
+            [Page(page, [], page_idx, page.shape[:2]) for page_idx, page in enumerate(pages)]
+        )
+
+    monkeypatch.setattr(main, "ocr_model", fake_ocr_model)
+    pdf_path = tmp_path / "scan.pdf"
+    with fitz.open() as doc:
+        for _ in range(6):
+            doc.new_page()
+        doc.save(pdf_path)
+
+    images, result, dimensions = asyncio.run(main.ocr_pdf(str(pdf_path), list(range(6)), dpi=72))
+    assert ocr_batches == [4, 2]
+    assert [page.page_idx for page in result.pages] == list(range(6))
+    assert dimensions == [(595, 842)] * 6
+    assert all(max(image.shape[:2]) == main.PREVIEW_SIDE for image in images)
+
+
+def use_database(monkeypatch, db_path) -> None:
+    """Point the history database at db_path."""
+    monkeypatch.setattr(database, "DATABASE_DIR", db_path.parent)
+    monkeypatch.setattr(database, "DATABASE_PATH", db_path)
+    monkeypatch.setattr(database, "DATABASE_URL", f"sqlite+aiosqlite:///{db_path}")
+
+
+def open_session() -> AsyncSession:
+    """Open a history database session, which init_database() must have set up."""
+    session = database.get_session()
+    assert session is not None, "database not initialized"
+    return session
+
+
+def test_init_database_adds_missing_indexes(monkeypatch, tmp_path) -> None:
+    """Test startup adds later indexes to a database created by an earlier schema."""
+    db_path = tmp_path / "ocr.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE processing_jobs (
+            id VARCHAR(36) PRIMARY KEY, filename VARCHAR(255) NOT NULL,
+            status VARCHAR(20) NOT NULL, error_message TEXT, total_pages INTEGER,
+            full_text TEXT, created_at DATETIME, completed_at DATETIME
+        );
+        CREATE INDEX idx_jobs_created ON processing_jobs (created_at);
+        CREATE TABLE processing_pages (
+            id VARCHAR(36) PRIMARY KEY,
+            job_id VARCHAR(36) NOT NULL REFERENCES processing_jobs (id),
+            page_number INTEGER NOT NULL, image_path VARCHAR(500), text TEXT,
+            confidence FLOAT, created_at DATETIME
+        );
+        CREATE INDEX idx_pages_job ON processing_pages (job_id);
+        """
+    )
+    conn.close()
+    use_database(monkeypatch, db_path)
+
+    async def init() -> bool:
+        try:
+            return await database.init_database()
+        finally:
+            await database.close_database()
+
+    assert asyncio.run(init())
+    conn = sqlite3.connect(db_path)
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    conn.close()
+    assert "idx_jobs_status_created" in indexes
+
+
+def test_failed_history_batch_retries_writes_singly(monkeypatch, tmp_path) -> None:
+    """Test one bad write in a batch does not lose the other writes."""
+    use_database(monkeypatch, tmp_path / "ocr.db")
+
+    def add_job(job_id: str) -> tuple[str, history_service.HistoryWrite]:
+        async def write(session) -> None:
+            session.add(database.ProcessingJob(id=job_id, filename=f"{job_id}.pdf"))
+
+        return f"Created job {job_id}", write
+
+    async def run() -> list[str]:
+        await database.init_database()
+        try:
+            # The second write repeats a primary key, so the batch commit fails
+            await history_service._apply_writes([add_job("a"), add_job("a"), add_job("b")])
+            async with open_session() as session:
+                result = await session.execute(select(database.ProcessingJob.id))
+                return sorted(result.scalars())
+        finally:
+            await database.close_database()
+
+    assert asyncio.run(run()) == ["a", "b"]
+
+
+def test_history_writer_round_trip(monkeypatch, tmp_path) -> None:
+    """Test a job written through the writer queue reads back and deletes in full."""
+    use_database(monkeypatch, tmp_path / "ocr.db")
+    monkeypatch.setattr(history_service, "IMAGES_DIR", tmp_path / "images")
+    page = np.zeros((80, 60, 3), dtype=np.uint8)
+
+    async def run() -> tuple[dict[str, Any] | None, bool, bool, dict[str, Any] | None, int]:
+        await database.init_database()
+        history_service.start_writer()
+        try:
+            job_id = await history_service.create_job("scan.pdf")
+            assert job_id is not None
+            await history_service.add_pages_bulk(
+                job_id, [(2, page, "second", 0.8), (1, page, "first", 0.9)]
+            )
+            await history_service.complete_job(job_id, "first\n\nsecond\n\n", 2)
+            # Reads go straight to the database, so wait for the writer
+            await history_service.stop_writer()
+            job = await history_service.get_job(job_id)
+            thumbnail_saved = (tmp_path / "images" / job_id / "page_1.webp").exists()
+            deleted = await history_service.delete_job(job_id)
+            async with open_session() as session:
+                pages = await session.scalar(select(func.count(database.ProcessingPage.id)))
+            return job, thumbnail_saved, deleted, await history_service.get_job(job_id), pages or 0
+        finally:
+            await history_service.stop_writer()
+            await database.close_database()
+
+    job, thumbnail_saved, deleted, after_delete, pages_left = asyncio.run(run())
+    assert job is not None
+    assert job["filename"] == "scan.pdf"
+    assert job["status"] == "completed"
+    assert job["total_pages"] == 2
+    assert job["full_text"] == "first\n\nsecond\n\n"
+    assert job["completed_at"] is not None
+    assert [(p["page_number"], p["text"]) for p in job["pages"]] == [(1, "first"), (2, "second")]
+    assert thumbnail_saved
+    assert deleted
+    assert after_delete is None
+    assert pages_left == 0
+    assert not (tmp_path / "images" / job["id"]).exists()
+
+
+def test_delete_job_waits_for_queued_writes(monkeypatch, tmp_path) -> None:
+    """Test deleting a job whose writes are still queued removes all of them."""
+    use_database(monkeypatch, tmp_path / "ocr.db")
+    monkeypatch.setattr(history_service, "IMAGES_DIR", tmp_path / "images")
+
+    async def run() -> tuple[bool, int, int]:
+        await database.init_database()
+        history_service.start_writer()
+        release = asyncio.Event()
+
+        async def stall(session: AsyncSession) -> None:
+            await release.wait()
+
+        try:
+            # Hold the writer up so the job's writes are all still queued
+            await history_service._submit("stall", "Stalled", stall)
+            job_id = await history_service.create_job("scan.pdf")
+            assert job_id is not None
+            page = np.zeros((80, 60, 3), dtype=np.uint8)
+            await history_service.add_pages_bulk(job_id, [(1, page, "text", 0.9)])
+            await history_service.complete_job(job_id, "text\n\n", 1)
+            delete = asyncio.create_task(history_service.delete_job(job_id))
+            await asyncio.sleep(0)
+            release.set()
+            deleted = await delete
+            async with open_session() as session:
+                jobs = await session.scalar(select(func.count(database.ProcessingJob.id)))
+                pages = await session.scalar(select(func.count(database.ProcessingPage.id)))
+            return deleted, jobs or 0, pages or 0
+        finally:
+            await history_service.stop_writer()
+            await database.close_database()
+
+    assert asyncio.run(run()) == (True, 0, 0)
+    assert not any((tmp_path / "images").iterdir())
+
+
+def test_history_write_is_dropped_when_queue_is_full(monkeypatch, tmp_path) -> None:
+    """Test a write that finds the queue full is dropped instead of waiting for room."""
+    use_database(monkeypatch, tmp_path / "ocr.db")
+    monkeypatch.setattr(history_service, "WRITE_QUEUE_SIZE", 1)
+
+    async def run() -> tuple[bool, bool]:
+        await database.init_database()
+        history_service.start_writer()
+        release = asyncio.Event()
+
+        async def stall(session: AsyncSession) -> None:
+            await release.wait()
+
+        try:
+            await history_service._submit("stall", "Stalled", stall)
+            # Let the writer take the stalled write off the queue
+            await asyncio.sleep(0)
+            queued = await history_service.fail_job("a", "error")
+            dropped = await history_service.fail_job("b", "error")
+            release.set()
+            return queued, dropped
+        finally:
+            await history_service.stop_writer()
+            await database.close_database()
+
+    assert asyncio.run(run()) == (True, False)
+
+
+def test_filename_search_fts_matches_ilike_fallback(monkeypatch, tmp_path) -> None:
+    """Test the trigram index finds the same jobs as the ILIKE fallback."""
+    use_database(monkeypatch, tmp_path / "ocr.db")
+    filenames = ["invoice_march.pdf", "Invoice-April.pdf", "receipt.pdf", "50%_off.pdf"]
+
+    async def search_all(terms: list[str]) -> list[list[str]]:
+        return [
+            sorted(job["filename"] for job in (await history_service.get_jobs(search=term))["jobs"])
+            for term in terms
+        ]
+
+    async def run() -> tuple[bool, list[list[str]], list[list[str]]]:
+        await database.init_database()
+        try:
+            async with open_session() as session:
+                session.add_all(
+                    database.ProcessingJob(id=str(i), filename=name)
+                    for i, name in enumerate(filenames)
+                )
+                await session.commit()
+            fts_available = database.fts_available
+            terms = ["voice", "INVOICE", "pt.pdf", "in", "50%", "zzz"]
+            with_fts = await search_all(terms)
+            monkeypatch.setattr(database, "fts_available", False)
+            return fts_available, with_fts, await search_all(terms)
+        finally:
+            await database.close_database()
+
+    fts_available, with_fts, with_ilike = asyncio.run(run())
+    assert fts_available
+    assert with_fts == with_ilike
+    assert with_fts[0] == ["Invoice-April.pdf", "invoice_march.pdf"]
+    assert with_fts[3] == ["Invoice-April.pdf", "invoice_march.pdf"]
+    assert with_fts[4] == ["50%_off.pdf"]
+    assert with_fts[5] == []
+
+
+def test_filename_index_is_only_built_when_created(monkeypatch, tmp_path) -> None:
+    """Test startup indexes existing jobs once, when it creates the FTS table."""
+    db_path = tmp_path / "ocr.db"
+    use_database(monkeypatch, db_path)
+
+    async def init_and_search() -> list[str]:
+        await database.init_database()
+        try:
+            result = await history_service.get_jobs(search="invoice")
+            return [job["filename"] for job in result["jobs"]]
+        finally:
+            await database.close_database()
+
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE processing_jobs (
+            id VARCHAR(36) PRIMARY KEY, filename VARCHAR(255) NOT NULL,
+            status VARCHAR(20) NOT NULL, error_message TEXT, total_pages INTEGER,
+            full_text BLOB, created_at DATETIME NOT NULL, completed_at DATETIME
+        );
+        INSERT INTO processing_jobs (id, filename, status, created_at)
+        VALUES ('1', 'invoice.pdf', 'completed', '2024-01-01 00:00:00');
+        """
+    )
+    conn.close()
+    assert asyncio.run(init_and_search()) == ["invoice.pdf"]
+
+    # Emptied behind the triggers' back, the index stays empty: no rebuild on restart
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"INSERT INTO {database.FTS_TABLE}({database.FTS_TABLE}) VALUES ('delete-all')")
+    conn.commit()
+    conn.close()
+    assert asyncio.run(init_and_search()) == []
+
+
+def test_compressed_text_round_trip() -> None:
+    """Test CompressedText stores compressed bytes and reads back legacy TEXT values."""
+    column = database.CompressedText()
+    value = "Página 1\n\n" + "lorem ipsum " * 200
+
+    stored = column.process_bind_param(value, None)
+    assert isinstance(stored, bytes)
+    assert len(stored) < len(value)
+    assert column.process_result_value(stored, None) == value
+    assert column.process_result_value("written before compression", None) == (
+        "written before compression"
+    )
+    assert column.process_bind_param(None, None) is None
+    assert column.process_result_value(None, None) is None
+
+
+def test_write_text_layer_places_words_at_their_boxes(tmp_path) -> None:
+    """Test the invisible text is written at each word's normalized box."""
+    input_path = tmp_path / "input.pdf"
+    output_path = tmp_path / "output.pdf"
+    with fitz.open() as doc:
+        doc.new_page(width=600, height=800)
+        doc.new_page(width=600, height=800)
+        doc.save(input_path)
+    boxes = {"Hello": [[0.1, 0.2], [0.3, 0.25]], "World": [[0.5, 0.6], [0.8, 0.65]]}
+
+    write_text_layer(
+        str(input_path),
+        str(output_path),
+        [[], [{"text": text, "confidence": 0.9, "bbox": bbox} for text, bbox in boxes.items()]],
+    )
+
+    with fitz.open(output_path) as doc:
+        assert doc[0].get_text("words") == []
+        words = {word[4]: word[:4] for word in doc[1].get_text("words")}
+    assert sorted(words) == ["Hello", "World"]
+    for text, ((x0, y0), (_, y1)) in boxes.items():
+        left, top, _, bottom = words[text]
+        assert abs(left - x0 * 600) < 1
+        # The baseline sits inside the box, so the glyphs overlap its vertical span
+        assert top < y1 * 800 and bottom > y0 * 800
+
+
+def test_is_bilevel() -> None:
+    """Test only (nearly) black and white pages count as bilevel."""
+    page = np.full((400, 300), 255, dtype=np.uint8)
+    page[100:200, 50:250] = 0
+    assert main.is_bilevel(page)
+
+    # Gray in 10 of the 75 sampled columns: about 13% mid-tones
+    page[:, :40] = 128
+    assert not main.is_bilevel(page)
+    assert main.is_bilevel(page, max_mid_tones=0.2)
+
+    gradient = np.tile(np.arange(256, dtype=np.uint8), (64, 1))
+    assert not main.is_bilevel(gradient)
+
+
+def test_fused_preprocessor_matches_doctr() -> None:
+    """Test FusedPreProcessor batches match docTR's PreProcessor within rounding."""
+    height, width = 300, 200
+    y, x = np.mgrid[0:height, 0:width]
+    page = np.stack([y * 255 / height, x * 255 / width, (x + y) * 127 / (height + width)], -1)
+    samples = [page.astype(np.uint8), page[:150].astype(np.float32) / 255]
+
+    for preserve_aspect_ratio, symmetric_pad in [(True, True), (True, False), (False, False)]:
+        pre_processor = PreProcessor(
+            (128, 128),
+            batch_size=2,
+            mean=(0.5, 0.4, 0.3),
+            std=(0.2, 0.25, 0.3),
+            preserve_aspect_ratio=preserve_aspect_ratio,
+            symmetric_pad=symmetric_pad,
+        )
+        expected = pre_processor(samples * 2)
+        actual = FusedPreProcessor(pre_processor)(samples * 2)
+
+        assert [batch.shape for batch in actual] == [batch.shape for batch in expected]
+        for fused, reference in zip(actual, expected):
+            # About two uint8 steps after normalizing with std 0.2
+            torch.testing.assert_close(fused, reference, rtol=0, atol=0.05)
+
+
+def test_padded_batch_does_not_recompile_for_short_batches() -> None:
+    """Test a backbone compiled for static shapes only sees the padded batch sizes."""
+    compiled_shapes: list[set[tuple[int, ...]]] = []
+
+    def backend(graph_module: torch.fx.GraphModule, example_inputs: list) -> Any:
+        # The inputs include the lifted parameters as well as the batch
+        compiled_shapes.append({tuple(tensor.shape) for tensor in example_inputs})
+        return graph_module.forward
+
+    torch._dynamo.reset()
+    backbone = torch.nn.Conv2d(3, 4, 3, padding=1).eval()
+    sizes = halving_batch_sizes(8, 2)
+    padded = PaddedBatch(torch.compile(backbone, backend=backend, dynamic=False), sizes)
+    short = torch.rand(3, 3, 8, 8)
+
+    with torch.no_grad():
+        for size in sizes:
+            padded(torch.rand(size, 3, 8, 8))
+        output = padded(short)
+        expected = backbone(short)
+
+    assert sizes == [2, 4, 8]
+    assert len(compiled_shapes) == 3
+    assert (4, 3, 8, 8) in compiled_shapes[1]
+    assert output.shape == (3, 4, 8, 8)
+    torch.testing.assert_close(output, expected)
+
+
+def test_temp_dir_without_room_for_uploads_is_not_used(monkeypatch, tmp_path) -> None:
+    """Test a TEMP_DIR too small for a maximum size request falls back to the default."""
+    monkeypatch.setattr(tempfile, "tempdir", None)
+    monkeypatch.setattr(main, "TEMP_DIR", str(tmp_path))
+
+    monkeypatch.setattr(main, "TEMP_DIR_MIN_FREE", shutil.disk_usage(tmp_path).total + 1)
+    main.configure_temp_dir()
+    assert tempfile.tempdir is None
+
+    monkeypatch.setattr(main, "TEMP_DIR_MIN_FREE", 0)
+    main.configure_temp_dir()
+    assert tempfile.tempdir == str(tmp_path)
+
+
+def test_preload_is_skipped_when_cuda_is_visible(monkeypatch) -> None:
+    """Test OCR_PRELOAD does not load the model at import when a GPU is visible."""
+    def fail(*args: Any, **kwargs: Any) -> Any:
+        raise AssertionError("model loaded at import")
+
+    monkeypatch.setenv("OCR_PRELOAD", "true")
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+    monkeypatch.setattr("doctr.models.ocr_predictor", fail)
+
+    spec = importlib.util.spec_from_file_location("preloaded_main", main.__file__)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    assert module.OCR_PRELOAD
+    assert module.ocr_model is None